@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+"""Minimal standalone runner for environments without asv:
+
+    python -m benchmarks [filter ...]
+
+runs every benchmark whose 'Class.method' name contains one of the filters and prints the
+best-of-three wall time of time_* benchmarks and the value of track_* benchmarks."""
+
+from __future__ import absolute_import, print_function
+
+import sys
+import inspect
+import itertools
+
+from timeit import default_timer
+
+from . import bench_array, bench_json, bench_index
+
+MODULES = (bench_array, bench_json, bench_index)
+
+
+def _benchmarks(filters):
+    for module in MODULES:
+        for name, cls in sorted(vars(module).items()):
+            if not inspect.isclass(cls) or cls.__module__ != module.__name__:
+                continue
+            methods = [m for m in sorted(dir(cls)) if m.startswith(('time_', 'track_')) and
+                       (not filters or any(f in '{}.{}'.format(name, m) for f in filters))]
+            if methods:
+                yield name, cls, methods
+
+
+def _run(instance, method, params):
+    func = getattr(instance, method)
+    if method.startswith('track_'):
+        return '{:.4g} {}'.format(func(*params), getattr(func, 'unit', ''))
+    best = None
+    for _ in range(3):
+        start = default_timer()
+        func(*params)
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return '{:.4g} ms'.format(best * 1e3)
+
+
+def main(filters):
+    for name, cls, methods in _benchmarks(filters):
+        params = getattr(cls, 'params', [])
+        if params and not isinstance(params[0], list):
+            params = [params]
+        for combination in itertools.product(*params):
+            instance = cls()
+            try:
+                instance.setup(*combination)
+            except NotImplementedError:
+                continue
+            try:
+                for method in methods:
+                    print('{}.{}({}): {}'.format(name, method, ', '.join(map(str, combination)),
+                                                 _run(instance, method, combination)))
+                    sys.stdout.flush()
+            finally:
+                instance.teardown(*combination)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
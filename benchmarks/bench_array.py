@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+from blox import File
+from blox.blosc import pack_blosc
+
+from .common import DTYPES, SIZES, CODECS, LEVELS, TempDir, make_array, throughput
+
+
+class ArraySuite(TempDir):
+    params = [DTYPES, SIZES, CODECS, LEVELS]
+    param_names = ['dtype', 'size', 'codec', 'level']
+    timeout = 600
+
+    def setup(self, dtype, size, codec, level):
+        if codec == 'none' and level != LEVELS[0]:
+            raise NotImplementedError
+        super(ArraySuite, self).setup()
+        self.data = make_array(dtype, size)
+        self.codec = codec
+        self.level = level
+
+    def write(self):
+        with File(self.filename, 'w') as f:
+            f.write_array('data', self.data, compression=self.codec, level=self.level)
+
+
+class WriteArray(ArraySuite):
+    def time_write_array(self, *params):
+        self.write()
+
+    def track_write_mb_per_s(self, *params):
+        return throughput(self.data.nbytes, self.write)
+    track_write_mb_per_s.unit = 'MB/s'
+
+    def track_ratio(self, *params):
+        meta, _ = pack_blosc(self.data, self.codec, self.level)
+        return self.data.nbytes / float(max(meta['length'], 1))
+    track_ratio.unit = 'ratio'
+
+
+class ReadArray(ArraySuite):
+    def setup(self, *params):
+        super(ReadArray, self).setup(*params)
+        self.write()
+
+    def read(self, mmap=False):
+        with File(self.filename, mmap=mmap) as f:
+            f.read('data')
+
+    def time_read(self, *params):
+        self.read()
+
+    def time_read_mmap(self, *params):
+        self.read(mmap=True)
+
+    def track_read_mb_per_s(self, *params):
+        return throughput(self.data.nbytes, self.read)
+    track_read_mb_per_s.unit = 'MB/s'
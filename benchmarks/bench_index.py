@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import numpy as np
+
+from blox import File
+
+from .common import TempDir
+
+
+class Index(TempDir):
+    params = [10, 100, 1000, 10000]
+    param_names = ['keys']
+    timeout = 600
+
+    def setup(self, keys):
+        super(Index, self).setup()
+        self.keys = ['group{}/key{}'.format(i % 10, i) for i in range(keys)]
+        self.array = np.arange(16)
+        with File(self.filename, 'w') as f:
+            for key in self.keys:
+                f.write_array(key, self.array)
+        self.file = File(self.filename)
+
+    def teardown(self, keys):
+        self.file.close()
+        super(Index, self).teardown()
+
+    def time_write_keys(self, keys):
+        with File(self.filename + '.new', 'w') as f:
+            for key in self.keys:
+                f.write_json(key, 1)
+
+    def time_write_keys_batch(self, keys):
+        with File(self.filename + '.new', 'w') as f:
+            with f.batch():
+                for key in self.keys:
+                    f.write_json(key, 1)
+
+    def time_open(self, keys):
+        File(self.filename).close()
+
+    def time_info(self, keys):
+        self.file.info(self.keys[len(self.keys) // 2])
+
+    def time_contains(self, keys):
+        self.keys[-1] in self.file
+
+    def time_read_small(self, keys):
+        self.file.read(self.keys[-1])
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+from blox import File
+
+from .common import TempDir
+
+
+class JSON(TempDir):
+    params = [10, 1000, 100000]
+    param_names = ['items']
+
+    def setup(self, items):
+        super(JSON, self).setup()
+        self.data = {'key{}'.format(i): [i, i * 0.5, 'value'] for i in range(items)}
+        with File(self.filename, 'w') as f:
+            f.write_json('data', self.data)
+
+    def time_write_json(self, items):
+        with File(self.filename, 'w') as f:
+            f.write_json('data', self.data)
+
+    def time_read_json(self, items):
+        with File(self.filename) as f:
+            f.read('data')
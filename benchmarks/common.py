@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from timeit import default_timer
+
+from blox.codecs import codec_list
+
+
+"""Benchmark sizes and compression levels can be overridden via environment variables, e.g.
+BLOX_BENCH_SIZES=1K,1M,256M,4G and BLOX_BENCH_LEVELS=1,9; sizes are in bytes with an
+optional K/M/G suffix. Large sizes are not part of the default matrix to keep runs short."""
+DEFAULT_SIZES = '1K,1M,64M'
+DEFAULT_LEVELS = '1,5,9'
+DTYPES = ['int64', 'float64', 'uint8', 'record']
+CODECS = codec_list()
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    scale = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}.get(text[-1:], 1)
+    return int(float(text.rstrip('KMG')) * scale)
+
+
+def format_size(size):
+    for suffix, scale in (('G', 1 << 30), ('M', 1 << 20), ('K', 1 << 10)):
+        if size >= scale and not size % scale:
+            return '{}{}'.format(size // scale, suffix)
+    return str(size)
+
+
+SIZES = [format_size(parse_size(size)) for size in
+         os.environ.get('BLOX_BENCH_SIZES', DEFAULT_SIZES).split(',')]
+LEVELS = [int(level) for level in os.environ.get('BLOX_BENCH_LEVELS', DEFAULT_LEVELS).split(',')]
+
+
+def make_array(kind, size):
+    rng = np.random.RandomState(0)
+    if kind == 'record':
+        dtype = np.dtype([('id', 'i8'), ('value', 'f8'), ('tag', 'S8')])
+        count = max(parse_size(size) // dtype.itemsize, 1)
+        data = np.empty(count, dtype)
+        data['id'] = np.arange(count)
+        data['value'] = np.cumsum(rng.standard_normal(count))
+        data['tag'] = np.array([b'alpha', b'beta', b'gamma'])[rng.randint(0, 3, count)]
+        return data.view(np.recarray)
+    dtype = np.dtype(kind)
+    count = max(parse_size(size) // dtype.itemsize, 1)
+    if kind == 'float64':
+        return np.cumsum(rng.standard_normal(count))
+    elif kind == 'uint8':
+        return rng.randint(32, 96, count).astype(np.uint8)
+    return np.arange(count, dtype=dtype) * 3 + rng.randint(0, 4, count)
+
+
+def throughput(nbytes, func, *args, **kwargs):
+    best = None
+    for _ in range(kwargs.pop('repeat', 3)):
+        start = default_timer()
+        func(*args)
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return nbytes / float(1 << 20) / max(best, 1e-9)
+
+
+class TempDir(object):
+    def setup(self, *params):
+        self.tmpdir = tempfile.mkdtemp(prefix='blox-bench-')
+        self.filename = os.path.join(self.tmpdir, 'bench.blx')
+
+    def teardown(self, *params):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
@@ -1,6 +1,14 @@
 # -*- coding: utf-8 -*-
 
-from blox.file import File, is_blox
+from blox.file import File, Array, Group, is_blox, repack, merge
+from blox.aio import AsyncFile
+from blox.dataset import Dataset
+from blox.compute import iter_blocks, map_blocks, reduce
+from blox.cache import ArrayCache
+from blox.stats import Stats
 from blox._version import __version__
 
-__all__ = ('File', 'is_blox', '__version__')
+__all__ = (
+    'File', 'Array', 'Group', 'is_blox', 'repack', 'merge', 'Dataset', 'iter_blocks', 'map_blocks',
+    'reduce', 'AsyncFile', 'ArrayCache', 'Stats', '__version__'
+)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import threading
+import functools
+
+try:
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    asyncio = None
+
+from blox.file import File
+
+
+class AsyncFile(object):
+    """Asyncio wrapper around File: reads, writes and closing run on a bounded thread pool
+    and return awaitable futures, so disk I/O and (de)compression never block the event loop.
+    Reads of read-only files run concurrently; all calls on writable files are serialized."""
+
+    def __init__(self, filename, mode=None, max_workers=None, executor=None, loop=None,
+                 **kwargs):
+        if asyncio is None:
+            raise ImportError('AsyncFile requires asyncio')
+        if executor is not None and max_workers is not None:
+            raise ValueError('unable to specify both executor and max_workers')
+        self._file = filename if isinstance(filename, File) else File(filename, mode, **kwargs)
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers)
+        self._loop = loop
+        self._lock = threading.Lock() if self._file.writable else None
+
+    @property
+    def file(self):
+        return self._file
+
+    @property
+    def filename(self):
+        return self._file.filename
+
+    @property
+    def writable(self):
+        return self._file.writable
+
+    def info(self, key):
+        return self._file.info(key)
+
+    def keys(self, prefix=None):
+        return self._file.keys(prefix)
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def __contains__(self, key):
+        return key in self._file
+
+    def __len__(self):
+        return len(self._file)
+
+    def read(self, key, out=None, rows=None, nthreads=None):
+        return self._run(self._file.read, key, out=out, rows=rows, nthreads=nthreads)
+
+    def write_json(self, key, data, overwrite=False):
+        return self._run(self._file.write_json, key, data, overwrite=overwrite)
+
+    def write_array(self, key, data, **kwargs):
+        return self._run(self._file.write_array, key, data, **kwargs)
+
+    def delete(self, key):
+        return self._run(self._file.delete, key)
+
+    def refresh(self):
+        return self._run(self._file.refresh)
+
+    def close(self):
+        future = self._run(self._file.close)
+        if self._own_executor:
+            future.add_done_callback(lambda _: self._executor.shutdown(wait=False))
+        return future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._file.close()
+        if self._own_executor:
+            self._executor.shutdown()
+
+    def __aenter__(self):
+        future = self._get_loop().create_future()
+        future.set_result(self)
+        return future
+
+    def __aexit__(self, exc_type, exc_val, exc_tb):
+        return self.close()
+
+    def _get_loop(self):
+        return self._loop or asyncio.get_event_loop()
+
+    def _run(self, func, *args, **kwargs):
+        if self._lock is not None:
+            func = self._locked(func)
+        return self._get_loop().run_in_executor(self._executor,
+                                                functools.partial(func, *args, **kwargs))
+
+    def _locked(self, func):
+        def wrapper(*args, **kwargs):
+            with self._lock:
+                return func(*args, **kwargs)
+        return wrapper
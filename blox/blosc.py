@@ -2,47 +2,290 @@
 
 from __future__ import absolute_import
 
+import os
 import six
 import blosc
+import threading
+import contextlib
 import numpy as np
 
-from blox.utils import read_json, write_json, flatten_dtype, restore_dtype
+from timeit import default_timer
 
+from blox.codecs import get_codec, get_filter, raw_bytes
+from blox.utils import read_json, write_json, flatten_dtype, restore_dtype, BufferStream
 
-def write_blosc(stream, data, compression='lz4', level=5, shuffle=True):
-    if isinstance(compression, six.string_types) and compression.startswith('blosc:'):
-        compression = compression[6:]
+
+"""Arrays larger than a single blosc buffer can hold are transparently split into frames
+along the leading axis; frames are read back in batches of up to READ_BUFFER_SIZE bytes.
+Streamed arrays with no explicit chunk size use frames of roughly DEFAULT_CHUNK_SIZE bytes."""
+MAX_FRAME_SIZE = blosc.MAX_BUFFERSIZE
+READ_BUFFER_SIZE = 1 << 24
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+
+"""Blosc only exposes process-wide thread count and block size settings. Calls that request
+specific settings (explicitly or via BLOX_NTHREADS / BLOX_BLOCKSIZE environment variables)
+pin them while they run; calls that agree on the pinned settings run concurrently, and
+conflicting ones wait until the settings are released."""
+_options = {}
+_options_condition = threading.Condition()
+
+
+"""With compression='auto' (or 'auto:speed', 'auto:ratio', 'auto:balanced'), every blosc
+compressor and shuffle setting is tried on a sample of up to AUTO_SAMPLE_SIZE bytes taken
+from AUTO_SAMPLE_BLOCKS evenly spaced blocks of the array; each candidate is timed as the
+best of AUTO_REPEAT runs and the one that best fits the target is recorded in 'comp'."""
+AUTO_SAMPLE_SIZE = 1 << 17
+AUTO_SAMPLE_BLOCKS = 4
+AUTO_REPEAT = 3
+AUTO_TARGETS = ('speed', 'ratio', 'balanced')
+
+
+def _env_option(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+@contextlib.contextmanager
+def blosc_options(nthreads=None, blocksize=None):
+    if nthreads is None:
+        nthreads = _env_option('BLOX_NTHREADS')
+    if blocksize is None:
+        blocksize = _env_option('BLOX_BLOCKSIZE')
+    options = {}
+    if nthreads is not None:
+        if nthreads < 1:
+            raise ValueError('invalid nthreads: expected positive integer, got {}'
+                             .format(nthreads))
+        options['nthreads'] = int(nthreads)
+    if blocksize is not None:
+        if blocksize < 0:
+            raise ValueError('invalid blocksize: expected non-negative integer, got {}'
+                             .format(blocksize))
+        options['blocksize'] = int(blocksize)
+    if not options:
+        yield
+        return
+    setters = {'nthreads': blosc.set_nthreads, 'blocksize': blosc.set_blocksize}
+    with _options_condition:
+        while any(_options.get(k, [v])[0] != v for k, v in options.items()):
+            _options_condition.wait()
+        for key, value in options.items():
+            if key not in _options:
+                # set_nthreads() returns the previous value; a block size of 0 means automatic
+                _options[key] = [value, 0, setters[key](value) or 0]
+            _options[key][1] += 1
+    try:
+        yield
+    finally:
+        with _options_condition:
+            for key in options:
+                _options[key][1] -= 1
+                if not _options[key][1]:
+                    setters[key](_options.pop(key)[2])
+            _options_condition.notify_all()
+
+
+def _row_items(shape):
+    return int(np.prod(shape[1:], dtype=np.int64))
+
+
+def _max_frame_rows(shape, itemsize):
+    row_size = _row_items(shape) * itemsize
+    if row_size > MAX_FRAME_SIZE:
+        raise ValueError('unable to split array into frames: row size {} exceeds {} bytes'
+                         .format(row_size, MAX_FRAME_SIZE))
+    return MAX_FRAME_SIZE // max(row_size, 1)
+
+
+def _decompress(meta, frame, out):
+    get_codec(meta['comp'][0]).decompress(frame, out)
+    for name in reversed(meta.get('filters', ())):
+        get_filter(name).decode(out)
+
+
+def _is_raw(meta):
+    return ('columns' not in meta and get_codec(meta['comp'][0]).zero_copy and
+            not meta.get('filters'))
+
+
+def normalize_compression(compression, level, shuffle):
+    codec = get_codec(compression)
+    return (codec.name,) + tuple(codec.normalize(level, shuffle))
+
+
+def auto_target(compression):
+    if not isinstance(compression, six.string_types) or \
+            compression.split(':', 1)[0] != 'auto':
+        return None
+    target = compression[5:] or 'balanced'
+    if target not in AUTO_TARGETS:
+        raise ValueError('invalid compression target: expected one of {}, got {!r}'
+                         .format(', '.join(AUTO_TARGETS), target))
+    return target
+
+
+def _auto_sample(data):
+    flat = data.view(np.ndarray).reshape(-1)
+    items = max(AUTO_SAMPLE_SIZE // AUTO_SAMPLE_BLOCKS // max(data.dtype.itemsize, 1), 1)
+    if len(flat) <= items * AUTO_SAMPLE_BLOCKS:
+        return flat
+    step = (len(flat) - items) // max(AUTO_SAMPLE_BLOCKS - 1, 1)
+    return np.concatenate([flat[i * step:i * step + items] for i in range(AUTO_SAMPLE_BLOCKS)])
+
+
+def _best_time(func, *args):
+    best = None
+    for _ in range(AUTO_REPEAT):
+        start = default_timer()
+        result = func(*args)
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def select_compression(data, target='balanced', level=5, filters=()):
+    sample = _auto_sample(data)
+    for name in filters:
+        sample = get_filter(name).encode(sample)
+    out = np.empty_like(sample)
+    scores = []
+    for cname in blosc.compressor_list():
+        for shuffle in (0, 1, 2):
+            codec = get_codec(cname)
+            frame, compress_time = _best_time(codec.compress, sample, level, shuffle)
+            _, decompress_time = _best_time(codec.decompress, frame, out)
+            elapsed = compress_time + decompress_time
+            score = {
+                'speed': (elapsed, len(frame)),
+                'ratio': (len(frame), elapsed),
+                'balanced': (len(frame) * elapsed,)
+            }[target]
+            scores.append((score, cname, shuffle))
+    _, cname, shuffle = min(scores)
+    return normalize_compression(cname, level, shuffle)
+
+
+def normalize_filters(filters, dtype):
+    if filters is None:
+        return ()
+    if isinstance(filters, six.string_types):
+        filters = (filters,)
+    for name in filters:
+        get_filter(name).check(dtype)
+    return tuple(filters)
+
+
+def check_array(data):
     data = np.asanyarray(data)
     if data.dtype == np.dtype('O'):
         raise ValueError('unable to serialize: invalid dtype')
     if not data.flags.contiguous:
         raise ValueError('expected contiguous array')
-    payload = blosc.compress_ptr(
-        data.__array_interface__['data'][0],
-        data.size,
-        data.dtype.itemsize,
-        cname=compression,
-        clevel=level,
-        shuffle=shuffle
-    )
+    return data
+
+
+def check_chunks(chunks, shape, dtype):
+    if chunks is not None:
+        chunks = int(chunks)
+        if chunks <= 0:
+            raise ValueError('invalid chunks: expected positive integer, got {}'.format(chunks))
+        if not shape:
+            raise ValueError('unable to chunk a zero-dimensional array')
+        chunks = min(chunks, _max_frame_rows(shape, dtype.itemsize))
+    elif int(np.prod(shape, dtype=np.int64)) * dtype.itemsize > MAX_FRAME_SIZE:
+        chunks = _max_frame_rows(shape, dtype.itemsize)
+    return chunks
+
+
+def default_chunks(shape, dtype):
+    return max(1, DEFAULT_CHUNK_SIZE // max(_row_items(shape) * dtype.itemsize, 1))
+
+
+def compress_frame(data, compression, level, shuffle, filters=()):
+    for name in filters:
+        data = get_filter(name).encode(data)
+    return get_codec(compression).compress(data, level, shuffle)
+
+
+def make_meta(shape, dtype, comp, chunks, lengths, filters=()):
+    offsets = np.cumsum([0] + list(lengths), dtype=np.int64).tolist()
     meta = {
-        'size': data.size * data.dtype.itemsize,
-        'length': len(payload),
-        'comp': (compression, level, int(shuffle)),
-        'shape': data.shape,
-        'dtype': flatten_dtype(data.dtype)
+        'size': int(np.prod(shape, dtype=np.int64)) * dtype.itemsize,
+        'length': offsets[-1],
+        'comp': tuple(comp),
+        'shape': tuple(shape),
+        'dtype': flatten_dtype(dtype)
     }
+    if chunks is not None:
+        meta['chunks'] = chunks
+        meta['offsets'] = offsets
+    if filters:
+        meta['filters'] = list(filters)
+    return meta
+
+
+def pack_blosc(data, compression='lz4', level=5, shuffle=True, chunks=None,
+               nthreads=None, blocksize=None, filters=None, columnar=False):
+    target = auto_target(compression)
+    if target is None:
+        comp = normalize_compression(compression, level, shuffle)
+    data = check_array(data)
+    if columnar and data.dtype.names:
+        return _pack_columns(data, compression, level, shuffle, chunks, nthreads, blocksize,
+                             filters)
+    filters = normalize_filters(filters, data.dtype)
+    chunks = check_chunks(chunks, data.shape, data.dtype)
+    with blosc_options(nthreads, blocksize):
+        if target is not None:
+            comp = select_compression(data, target, level, filters)
+        if chunks is None:
+            frames = [compress_frame(data, *comp, filters=filters)]
+        else:
+            frames = [compress_frame(data[start:start + chunks], *comp, filters=filters)
+                      for start in range(0, len(data), chunks)]
+    meta = make_meta(data.shape, data.dtype, comp, chunks, map(len, frames), filters)
+    return meta, frames
+
+
+def _pack_columns(data, compression, level, shuffle, chunks, nthreads, blocksize, filters):
+    columns, frames, start = [], [], 0
+    for name in data.dtype.names:
+        column = np.ascontiguousarray(data.view(np.ndarray)[name])
+        meta, column_frames = pack_blosc(column, compression, level, shuffle, chunks,
+                                         nthreads, blocksize, filters)
+        meta['start'] = start
+        start += meta['length']
+        columns.append([name, meta])
+        frames.extend(column_frames)
+    meta = make_meta(data.shape, data.dtype, columns[0][1]['comp'], None, [start])
+    meta['columns'] = columns
+    meta['columnar'] = True
+    # with compression='auto', each column picks its own codec; 'comp' is only kept if shared
+    meta['column_comp'] = [[name, column['comp']] for name, column in columns]
+    if len(set(column['comp'] for _, column in columns)) > 1:
+        del meta['comp']
+    if all('chunks' in column for _, column in columns):
+        meta['chunks'] = min(column['chunks'] for _, column in columns)
+    return meta, frames
+
+
+def write_packed(stream, meta, frames):
     meta_length = write_json(stream, meta)
-    stream.write(payload)
-    return len(payload) + meta_length
+    for frame in frames:
+        stream.write(frame)
+    return meta['length'] + meta_length
 
 
-def read_blosc(stream, out=None):
-    meta = read_json(stream)
-    shape = tuple(meta['shape'])
-    dtype = restore_dtype(meta['dtype'])
+def write_blosc(stream, data, compression='lz4', level=5, shuffle=True, chunks=None,
+                nthreads=None, blocksize=None, filters=None, columnar=False):
+    return write_packed(stream, *pack_blosc(data, compression, level, shuffle, chunks,
+                                            nthreads, blocksize, filters, columnar))
+
+
+def _check_out(out, shape, dtype):
     if out is None:
-        out = np.empty(shape, dtype)
+        return np.empty(shape, dtype)
     elif not isinstance(out, np.ndarray):
         raise TypeError('expected ndarray, got {}'.format(type(out).__name__))
     elif out.shape != shape:
@@ -51,10 +294,207 @@ def read_blosc(stream, out=None):
         raise ValueError('incompatible dtype: expected {}, got {}'.format(dtype, out.dtype))
     elif not out.flags.contiguous:
         raise ValueError('expected contiguous array')
-    blosc.decompress_ptr(
-        stream.read(meta['length']),
-        out.__array_interface__['data'][0]
-    )
+    return out
+
+
+def _read_rows(stream, meta, base, start, stop, out, frame=None):
+    chunks, offsets = meta['chunks'], meta['offsets']
+    origin = start
+    if frame is not None and frame[0] is not None and \
+            frame[0] * chunks <= start < (frame[0] + 1) * chunks:
+        lo = frame[0] * chunks
+        hi = min(lo + chunks, stop)
+        out[:hi - start] = frame[1][start - lo:hi - lo]
+        start = hi
+        if start >= stop:
+            return
+    first, last = start // chunks, (stop - 1) // chunks + 1
+    tmp = None if frame is None else frame[1]
+    while first < last:
+        end = first + 1
+        while end < last and offsets[end + 1] - offsets[first] <= READ_BUFFER_SIZE:
+            end += 1
+        stream.seek(base + offsets[first])
+        payload = memoryview(stream.read(offsets[end] - offsets[first]))
+        for index in range(first, end):
+            data = payload[offsets[index] - offsets[first]:offsets[index + 1] - offsets[first]]
+            lo, hi = index * chunks, min((index + 1) * chunks, meta['shape'][0])
+            if start <= lo and hi <= stop:
+                _decompress(meta, data, out[lo - origin:hi - origin])
+            else:
+                if tmp is None:
+                    tmp = np.empty((chunks,) + out.shape[1:], out.dtype)
+                _decompress(meta, data, tmp[:hi - lo])
+                if frame is not None:
+                    frame[:] = [index, tmp]
+                lo_, hi_ = max(lo, start), min(hi, stop)
+                out[lo_ - origin:hi_ - origin] = tmp[lo_ - lo:hi_ - lo]
+        first = end
+
+
+def _read_single(stream, meta, shape, dtype):
+    out = np.empty(shape, dtype)
+    _decompress(meta, stream.read(meta['length']), out)
+    return out
+
+
+def _read_view(stream, meta, base, shape, dtype, rows):
+    stream.seek(base)
+    out = np.frombuffer(stream.read(meta['length']), dtype,
+                        count=int(np.prod(shape, dtype=np.int64))).reshape(shape)
+    if rows is not None:
+        if not shape:
+            raise ValueError('unable to select rows of a zero-dimensional array')
+        if not isinstance(rows, slice):
+            raise TypeError('expected slice, got {}'.format(type(rows).__name__))
+        out = out[rows]
+    return out
+
+
+def read_blosc(stream, out=None, rows=None, nthreads=None, fields=None):
+    with blosc_options(nthreads):
+        return _read_blosc(stream, out, rows, fields)
+
+
+def _read_meta(stream):
+    offset = stream.tell()
+    meta = read_json(stream)
+    base = stream.tell() if 'prefix' not in meta else offset - meta['prefix']
+    return meta, base, tuple(meta['shape']), restore_dtype(meta['dtype'])
+
+
+def _select_fields(dtype, fields):
+    if fields is None:
+        return dtype
+    if dtype.names is None:
+        raise ValueError('can only select fields of structured arrays')
+    if isinstance(fields, six.string_types):
+        fields = [fields]
+    if not fields:
+        raise ValueError('expected at least one field')
+    for name in fields:
+        if name not in dtype.names:
+            raise ValueError('unknown field: {!r}'.format(name))
+    selected = np.dtype([(name, dtype.fields[name][0]) for name in fields])
+    return np.dtype((np.record, selected)) if dtype.type is np.record else selected
+
+
+def _read_columns(stream, meta, base, shape, dtype, out, rows, fields, frames=None):
+    selected = _select_fields(dtype, fields)
+    if 'columns' in meta:
+        columns = dict((name, column) for name, column in meta['columns'])
+        values = []
+        for name in selected.names:
+            column = columns[name]
+            frame = None if frames is None else frames.setdefault(name, [None, None])
+            values.append((name, _read_data(stream, column, base + column['start'],
+                                            tuple(column['shape']),
+                                            restore_dtype(column['dtype']), None, rows, frame)))
+        count = values[0][1].shape[:len(shape)]
+    else:
+        data = _read_data(stream, meta, base, shape, dtype, None, rows,
+                          None if frames is None else frames.setdefault(None, [None, None]))
+        values = [(name, data[name]) for name in selected.names]
+        count = data.shape
+    out = _check_out(out, count, selected)
+    for name, value in values:
+        out[name] = value
+    return out
+
+
+def _read_blosc(stream, out, rows, fields=None):
+    meta, base, shape, dtype = _read_meta(stream)
+    if fields is not None or 'columns' in meta:
+        out = _read_columns(stream, meta, base, shape, dtype, out, rows, fields)
+    else:
+        out = _read_data(stream, meta, base, shape, dtype, out, rows)
+    return _as_recarray(out)
+
+
+def _read_data(stream, meta, base, shape, dtype, out, rows, frame=None):
+    stream.seek(base)
+    if out is None and _is_raw(meta) and isinstance(stream, BufferStream):
+        out = _read_view(stream, meta, base, shape, dtype, rows)
+    elif rows is None:
+        out = _check_out(out, shape, dtype)
+        if 'chunks' in meta:
+            if shape[0]:
+                _read_rows(stream, meta, base, 0, shape[0], out)
+        elif _is_raw(meta):
+            stream.readinto(raw_bytes(out))
+        else:
+            _decompress(meta, stream.read(meta['length']), out)
+    else:
+        if not shape:
+            raise ValueError('unable to select rows of a zero-dimensional array')
+        if not isinstance(rows, slice):
+            raise TypeError('expected slice, got {}'.format(type(rows).__name__))
+        start, stop, step = rows.indices(shape[0])
+        count = len(six.moves.range(start, stop, step))
+        out = _check_out(out, (count,) + shape[1:], dtype)
+        if count:
+            first, last = start, start + (count - 1) * step
+            lo, hi = min(first, last), max(first, last) + 1
+            if 'chunks' not in meta:
+                if frame is None or frame[0] is None:
+                    data = _read_single(stream, meta, shape, dtype)
+                    if frame is not None:
+                        frame[:] = [0, data]
+                else:
+                    data = frame[1]
+                out[...] = data[first::step][:count]
+            elif step == 1:
+                _read_rows(stream, meta, base, lo, hi, out, frame)
+            else:
+                block = np.empty((hi - lo,) + shape[1:], dtype)
+                _read_rows(stream, meta, base, lo, hi, block)
+                out[...] = block[first - lo::step][:count]
+    return out
+
+
+def iter_blosc(stream, rows=None, out=None, nthreads=None, fields=None):
+    meta, base, shape, dtype = _read_meta(stream)
+    if not shape:
+        raise ValueError('unable to iterate over a zero-dimensional array')
+    chunks = meta['columns'][0][1].get('chunks') if 'columns' in meta else meta.get('chunks')
+    rows = int(chunks or max(shape[0], 1) if rows is None else rows)
+    if rows <= 0:
+        raise ValueError('invalid rows: expected positive integer, got {}'.format(rows))
+    if out is not None:
+        _check_out(out, (rows,) + shape[1:], _select_fields(dtype, fields))
+    if fields is not None or 'columns' in meta:
+        frames = {}
+        for start in range(0, shape[0], rows):
+            stop = min(start + rows, shape[0])
+            with blosc_options(nthreads):
+                block = _read_columns(stream, meta, base, shape, dtype,
+                                      None if out is None else out[:stop - start],
+                                      slice(start, stop), fields, frames)
+            yield _as_recarray(block)
+        return
+    if _is_raw(meta) and out is None and isinstance(stream, BufferStream):
+        data = _read_view(stream, meta, base, shape, dtype, None)
+    elif 'chunks' not in meta:
+        with blosc_options(nthreads):
+            data = _read_single(stream, meta, shape, dtype)
+    else:
+        data, frame = None, [None, None]
+    for start in range(0, shape[0], rows):
+        stop = min(start + rows, shape[0])
+        if data is not None:
+            block = data[start:stop]
+            if out is not None:
+                out[:stop - start] = block
+                block = out[:stop - start]
+        else:
+            block = np.empty((rows,) + shape[1:], dtype) if out is None else out
+            block = block[:stop - start]
+            with blosc_options(nthreads):
+                _read_rows(stream, meta, base, start, stop, block, frame)
+        yield _as_recarray(block)
+
+
+def _as_recarray(out):
     if out.dtype.type is np.record:
         out = out.view(np.recarray)
     return out
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import threading
+
+from collections import OrderedDict
+
+
+class ArrayCache(object):
+    """LRU cache of decompressed arrays bounded by their total size in bytes. Cached arrays
+    are made read-only, while arrays larger than the cache are returned untouched; a single
+    instance may be shared between several files."""
+
+    def __init__(self, max_bytes):
+        max_bytes = int(max_bytes)
+        if max_bytes < 0:
+            raise ValueError('invalid max_bytes: expected non-negative integer, got {}'
+                             .format(max_bytes))
+        self._max_bytes = max_bytes
+        self._nbytes = 0
+        self._arrays = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    def __len__(self):
+        return len(self._arrays)
+
+    def __contains__(self, key):
+        return key in self._arrays
+
+    def get(self, key, count_miss=True):
+        with self._lock:
+            array = self._arrays.pop(key, None)
+            if array is None:
+                if count_miss:
+                    self._misses += 1
+                return None
+            self._arrays[key] = array
+            self._hits += 1
+            return array
+
+    def put(self, key, array):
+        with self._lock:
+            previous = self._arrays.pop(key, None)
+            if previous is not None:
+                self._nbytes -= previous.nbytes
+            if array.nbytes > self._max_bytes:
+                return array
+            array.flags.writeable = False
+            self._arrays[key] = array
+            self._nbytes += array.nbytes
+            while self._nbytes > self._max_bytes:
+                _, evicted = self._arrays.popitem(last=False)
+                self._nbytes -= evicted.nbytes
+        return array
+
+    def clear(self):
+        with self._lock:
+            self._arrays.clear()
+            self._nbytes = 0
+            self._hits = self._misses = 0
+
+    def __repr__(self):
+        return '<blox.ArrayCache: {} arrays, {}/{} bytes, {} hits, {} misses>'.format(
+            len(self), self._nbytes, self._max_bytes, self._hits, self._misses)
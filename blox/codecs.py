@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import six
+import blosc
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+
+def raw_bytes(data):
+    return data.view(np.ndarray).reshape(-1).view(np.uint8)
+
+
+class Codec(object):
+    """Compresses contiguous arrays into frames and decompresses frames into contiguous
+    arrays; the codec name is stored in the 'comp' metadata field of every array."""
+
+    name = None
+    zero_copy = False
+
+    def normalize(self, level, shuffle):
+        return level, int(shuffle)
+
+    def compress(self, data, level, shuffle):
+        raise NotImplementedError
+
+    def decompress(self, frame, out):
+        raise NotImplementedError
+
+
+class BloscCodec(Codec):
+    def __init__(self, cname):
+        self.name = cname
+
+    def compress(self, data, level, shuffle):
+        return blosc.compress_ptr(data.__array_interface__['data'][0], data.size,
+                                  data.dtype.itemsize, cname=self.name, clevel=level,
+                                  shuffle=shuffle)
+
+    def decompress(self, frame, out):
+        blosc.decompress_ptr(frame, out.__array_interface__['data'][0])
+
+
+class RawCodec(Codec):
+    name = 'none'
+    zero_copy = True
+
+    def normalize(self, level, shuffle):
+        return 0, 0
+
+    def compress(self, data, level, shuffle):
+        return raw_bytes(data)
+
+    def decompress(self, frame, out):
+        raw_bytes(out)[:] = np.frombuffer(frame, np.uint8)
+
+
+class ZstandardCodec(Codec):
+    name = 'zstandard'
+
+    def normalize(self, level, shuffle):
+        return level, 0
+
+    def compress(self, data, level, shuffle):
+        return zstandard.ZstdCompressor(level=level).compress(raw_bytes(data))
+
+    def decompress(self, frame, out):
+        raw_bytes(out)[:] = np.frombuffer(zstandard.ZstdDecompressor().decompress(
+            frame, max_output_size=out.nbytes), np.uint8)
+
+
+class LZ4FrameCodec(Codec):
+    name = 'lz4frame'
+
+    def normalize(self, level, shuffle):
+        return level, 0
+
+    def compress(self, data, level, shuffle):
+        return lz4_frame.compress(raw_bytes(data), compression_level=level,
+                                  content_checksum=False)
+
+    def decompress(self, frame, out):
+        raw_bytes(out)[:] = np.frombuffer(lz4_frame.decompress(frame), np.uint8)
+
+
+class Filter(object):
+    """Reversible transform applied to each frame before compression; filter names are
+    stored in the 'filters' metadata field in the order they were applied."""
+
+    name = None
+
+    def check(self, dtype):
+        pass
+
+    def encode(self, data):
+        raise NotImplementedError
+
+    def decode(self, data):
+        raise NotImplementedError
+
+
+class _IntegerFilter(Filter):
+    def check(self, dtype):
+        if dtype.fields is not None or dtype.subdtype is not None or \
+                dtype.itemsize not in (1, 2, 4, 8):
+            raise ValueError('{} filter: unsupported dtype: {}'.format(self.name, dtype))
+
+    def _view(self, data):
+        return data.view(np.ndarray).reshape(-1).view('u{}'.format(data.dtype.itemsize))
+
+
+class DeltaFilter(_IntegerFilter):
+    name = 'delta'
+
+    def encode(self, data):
+        values = self._view(data)
+        out = np.empty_like(values)
+        out[:1] = values[:1]
+        np.subtract(values[1:], values[:-1], out=out[1:])
+        return out.view(data.dtype).reshape(data.shape)
+
+    def decode(self, data):
+        values = self._view(data)
+        np.cumsum(values, dtype=values.dtype, out=values)
+
+
+class XORFilter(_IntegerFilter):
+    name = 'xor'
+
+    def encode(self, data):
+        values = self._view(data)
+        out = np.empty_like(values)
+        out[:1] = values[:1]
+        np.bitwise_xor(values[1:], values[:-1], out=out[1:])
+        return out.view(data.dtype).reshape(data.shape)
+
+    def decode(self, data):
+        values = self._view(data)
+        np.bitwise_xor.accumulate(values, out=values)
+
+
+_codecs = {}
+_filters = {}
+
+
+def register_codec(codec):
+    _codecs[codec.name] = codec
+
+
+def register_filter(filter):
+    _filters[filter.name] = filter
+
+
+def get_codec(name):
+    if isinstance(name, six.string_types) and name.startswith('blosc:'):
+        name = name[6:]
+    try:
+        return _codecs[name]
+    except (KeyError, TypeError):
+        raise ValueError('unknown compression: {!r}'.format(name))
+
+
+def get_filter(name):
+    try:
+        return _filters[name]
+    except (KeyError, TypeError):
+        raise ValueError('unknown filter: {!r}'.format(name))
+
+
+def codec_list():
+    return sorted(_codecs)
+
+
+def filter_list():
+    return sorted(_filters)
+
+
+for _cname in blosc.compressor_list():
+    register_codec(BloscCodec(_cname))
+register_codec(RawCodec())
+if zstandard is not None:
+    register_codec(ZstandardCodec())
+if lz4_frame is not None:
+    register_codec(LZ4FrameCodec())
+register_filter(DeltaFilter())
+register_filter(XORFilter())
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import numbers
+import numpy as np
+
+from blox.utils import thread_map
+
+
+"""Blockwise computations stream an array in blocks of consecutive rows (by default, one block
+per stored chunk), each block being decompressed once as it is read and then processed in a
+thread pool. At most about twice as many blocks as there are workers are held in memory at any
+time regardless of the array size; since the bound is in blocks rather than bytes, pass a
+smaller number of rows for arrays stored in large chunks."""
+
+
+def _blocks(file, key, rows):
+    info = file.info(key)
+    if info['type'] != 'array':
+        raise ValueError('can only compute over array values')
+    shape = info['shape']
+    if not shape:
+        raise ValueError('unable to split a zero-dimensional array into blocks')
+    if rows is None:
+        rows = info.get('chunks') or max(shape[0], 1)
+    if not isinstance(rows, numbers.Integral) or isinstance(rows, bool) or rows <= 0:
+        raise ValueError('invalid rows: expected positive integer, got {!r}'.format(rows))
+    return shape, rows
+
+
+def iter_blocks(file, key, func=None, rows=None, max_workers=None, nthreads=None):
+    shape, rows = _blocks(file, key, rows)
+    if shape[0]:
+        blocks = file.iter_chunks(key, rows=rows, nthreads=nthreads)
+    else:
+        blocks = [file.read(key, nthreads=nthreads)]
+    if func is None:
+        return iter(blocks)
+    return thread_map(func, blocks, max_workers)
+
+
+def map_blocks(file, key, func, out_key, out_file=None, rows=None, max_workers=None,
+               nthreads=None, **kwargs):
+    out_file = file if out_file is None else out_file
+    if not getattr(out_file, 'writable', False):
+        raise IOError('the output file is not writable; pass a writable out_file')
+    kwargs.setdefault('chunk_rows', _blocks(file, key, rows)[1])
+    kwargs.setdefault('nthreads', nthreads)
+    writer = None
+    try:
+        for result in iter_blocks(file, key, func, rows, max_workers, nthreads):
+            result = np.asarray(result)
+            if writer is None:
+                writer = out_file.array_writer(out_key, result.dtype, **kwargs)
+            writer.append(result)
+    except:
+        if writer is not None:
+            writer.abort()
+        raise
+    writer.close()
+
+
+def reduce(file, key, ufunc, axis=0, dtype=None, rows=None, max_workers=None, nthreads=None):
+    ndim = len(_blocks(file, key, rows)[0])
+    if axis is None:
+        axes = tuple(range(ndim))
+    else:
+        axes = axis if isinstance(axis, tuple) else (axis,)
+        for ax in axes:
+            if not isinstance(ax, numbers.Integral) or not -ndim <= ax < ndim:
+                raise ValueError('invalid axis: {!r} for an array of dimension {}'
+                                 .format(ax, ndim))
+        axes = tuple(sorted(set(ax % ndim for ax in axes)))
+
+    def partial(block):
+        return ufunc.reduce(block, axis=axes, dtype=dtype)
+
+    results = iter_blocks(file, key, partial, rows, max_workers, nthreads)
+    if 0 not in axes:
+        return np.concatenate(list(results))
+    out = None
+    for result in results:
+        out = result if out is None else ufunc(out, result, out=out if out.ndim else None)
+    return out
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import io
+import os
+import six
+import uuid
+import atexit
+import heapq
+import socket
+import numpy as np
+
+from blox.file import File, Array
+from blox.utils import json
+
+
+"""A dataset is either a directory holding one blox file per shard (every file ending with
+SHARD_SUFFIX, in sorted order) or a JSON manifest of the form {"shards": [path, ...]} with
+paths relative to the manifest. Shards written through a dataset directory are created with
+PARTIAL_SUFFIX appended and renamed into place on close, so readers never list a shard that
+is still being written. A key stored in several shards is read as the concatenation of its
+parts along the leading axis, in shard order."""
+SHARD_SUFFIX = '.blx'
+PARTIAL_SUFFIX = '.part'
+
+
+"""File options that only apply to reading shards and aren't passed to shards being written."""
+READER_OPTIONS = ('mmap', 'cache')
+
+
+class Shard(File):
+    def __init__(self, filename, **kwargs):
+        self._published = filename
+        super(Shard, self).__init__(filename + PARTIAL_SUFFIX, 'w', **kwargs)
+        # exit handlers run in reverse order, so a shard still open at exit is discarded
+        # before the close() registered by File gets a chance to publish it
+        atexit.register(self.abort)
+
+    def close(self):
+        published = self._handle is None
+        super(Shard, self).close()
+        if not published:
+            getattr(os, 'replace', os.rename)(self.filename, self._published)
+
+    def abort(self):
+        if self._handle is None:
+            return
+        super(Shard, self).close()
+        os.remove(self.filename)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class Dataset(object):
+    def __init__(self, path, mode='r', **kwargs):
+        if mode not in ('r', 'a'):
+            raise ValueError('invalid mode: {!r}; expected r/a'.format(mode))
+        path = os.path.abspath(os.path.expanduser(str(path)))
+        if mode == 'a' and not os.path.exists(path):
+            os.makedirs(path)
+        if not os.path.exists(path):
+            raise IOError('no such dataset: {!r}'.format(path))
+        if mode == 'a' and not os.path.isdir(path):
+            raise ValueError('unable to add shards to a manifest')
+        self._path = path
+        self._mode = mode
+        self._options = kwargs
+        self._shards = []
+        self._files = {}
+        self._parts = {}
+        self.refresh()
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def mode(self):
+        return self._mode
+
+    @property
+    def shards(self):
+        return list(self._shards)
+
+    def refresh(self):
+        if os.path.isdir(self._path):
+            shards = sorted(os.path.join(self._path, name) for name in os.listdir(self._path)
+                            if name.endswith(SHARD_SUFFIX))
+        else:
+            with io.open(self._path, 'r', encoding='utf-8') as fd:
+                manifest = json.loads(fd.read())
+            root = os.path.dirname(self._path)
+            shards = [os.path.join(root, shard) for shard in manifest['shards']]
+        for filename in set(self._files) - set(shards):
+            self._files.pop(filename).close()
+        self._shards = shards
+        self._parts = {}
+
+    def create_shard(self, name=None):
+        if self._mode != 'a':
+            raise IOError('the dataset is not writable')
+        if name is None:
+            name = '{}-{}-{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        options = dict((option, value) for option, value in self._options.items()
+                       if option not in READER_OPTIONS)
+        return Shard(os.path.join(self._path, name + SHARD_SUFFIX), **options)
+
+    def keys(self, prefix=None):
+        keys = heapq.merge(*[self._file(shard).keys(prefix) for shard in self._shards])
+        result = []
+        for key in keys:
+            if not result or result[-1] != key:
+                result.append(key)
+        return result
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, key):
+        return bool(self._find(key))
+
+    def __getitem__(self, key):
+        parts = self._check_parts(key)
+        if self._is_array(parts, key):
+            return Array(self, key)
+        return parts[0].read(key)
+
+    def info(self, key):
+        parts = self._check_parts(key)
+        info = parts[0].info(key)
+        if self._is_array(parts, key) and len(parts) > 1:
+            info['shape'] = (sum(shape[0] for shape in self._shapes(parts, key)),) + \
+                info['shape'][1:]
+            info['shards'] = len(parts)
+        return info
+
+    def shape(self, key):
+        return self.info(key).get('shape')
+
+    def dtype(self, key):
+        return self.info(key).get('dtype')
+
+    def read(self, key, out=None, rows=None, nthreads=None):
+        parts = self._check_parts(key)
+        if len(parts) == 1 or not self._is_array(parts, key):
+            return parts[0].read(key, out=out, rows=rows, nthreads=nthreads)
+        lengths = [shape[0] for shape in self._shapes(parts, key)]
+        if rows is None:
+            rows = slice(None)
+        elif not isinstance(rows, slice):
+            raise TypeError('expected slice, got {}'.format(type(rows).__name__))
+        start, stop, step = rows.indices(sum(lengths))
+        indices = np.arange(start, stop, step)
+        bounds = np.cumsum([0] + lengths)
+        blocks = []
+        for i, part in enumerate(parts):
+            local = indices[(indices >= bounds[i]) & (indices < bounds[i + 1])] - bounds[i]
+            if len(local):
+                end = int(local[0]) + len(local) * step
+                blocks.append(part.read(key, rows=slice(int(local[0]), None if end < 0 else end,
+                                                        step), nthreads=nthreads))
+        if step < 0:
+            blocks.reverse()
+        if not blocks:
+            blocks.append(parts[0].read(key, rows=slice(0, 0), nthreads=nthreads))
+        if out is None:
+            return np.concatenate(blocks)
+        np.concatenate(blocks, out=out)
+        return out
+
+    def iter_chunks(self, key, rows=None, nthreads=None):
+        parts = self._check_parts(key)
+        if not self._is_array(parts, key):
+            raise ValueError('can only iterate over array values')
+        self._shapes(parts, key)
+        for part in parts:
+            for chunk in part.iter_chunks(key, rows=rows, nthreads=nthreads):
+                yield chunk
+
+    def close(self):
+        for file in self._files.values():
+            file.close()
+        self._files = {}
+        self._parts = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return '<blox.Dataset {!r}: {} shards>'.format(self._path, len(self._shards))
+
+    def _file(self, filename):
+        file = self._files.get(filename)
+        if file is None:
+            file = self._files[filename] = File(filename, 'r', **self._options)
+        return file
+
+    def _find(self, key):
+        parts = self._parts.get(key)
+        if parts is None:
+            if not isinstance(key, six.string_types):
+                raise ValueError('invalid key: expected string, got {}'
+                                 .format(type(key).__name__))
+            parts = [self._file(shard) for shard in self._shards
+                     if key in self._file(shard)]
+            self._parts[key] = parts
+        return parts
+
+    def _check_parts(self, key):
+        parts = self._find(key)
+        if not parts:
+            raise KeyError(key)
+        return parts
+
+    def _is_array(self, parts, key):
+        types = set(part.info(key)['type'] for part in parts)
+        if len(parts) > 1 and types != {'array'}:
+            raise ValueError('key {!r} holds JSON values in multiple shards'.format(key))
+        return types == {'array'}
+
+    def _shapes(self, parts, key):
+        infos = [part.info(key) for part in parts]
+        for info in infos:
+            if not info['shape'] or info['shape'][1:] != infos[0]['shape'][1:] or \
+                    info['dtype'] != infos[0]['dtype']:
+                raise ValueError('incompatible parts of {!r}: {} {} and {} {}'.format(
+                    key, infos[0]['shape'], infos[0]['dtype'], info['shape'], info['dtype']))
+        return [info['shape'] for info in infos]
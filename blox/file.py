@@ -7,9 +7,27 @@ import os
 import sys
 import six
 import atexit
-
-from blox.blosc import read_blosc, write_blosc
-from blox.utils import read_i64, write_i64, read_json, write_json, restore_dtype
+import struct
+import numbers
+import threading
+import contextlib
+import numpy as np
+from mmap import mmap as memory_map, ACCESS_READ
+
+from blox.blosc import (
+    read_blosc, iter_blosc, pack_blosc, write_packed, normalize_compression, normalize_filters,
+    auto_target, select_compression, check_chunks, default_chunks, compress_frame, make_meta,
+    blosc_options
+)
+from blox.utils import (
+    read_i64, write_i64, read_json, write_json, restore_dtype, thread_map, copy_range,
+    BufferStream, PositionalStream, CountingStream
+)
+from blox.cache import ArrayCache
+from blox.stats import Stats
+from blox.index import (
+    BinaryIndex, SortedIndex, is_binary_index, read_index_size, write_binary_index
+)
 
 
 """The following signature is a direct descendent of PNG and HDF5 file signatures:
@@ -24,8 +42,50 @@ from blox.utils import read_i64, write_i64, read_json, write_json, restore_dtype
 FORMAT_STRING = b'\211BLX\r\n\032\n'
 
 """Format version is stored as a little-endian integer in the 8 bytes following the initial
-signature, and should only be increased if backwards-incompatible changes are introduced."""
-FORMAT_VERSION = 1
+signature, and should only be increased if backwards-incompatible changes are introduced.
+Files of any version from MIN_FORMAT_VERSION onwards can be read; appending to a version 1
+file upgrades it to version 2, which introduced the binary index. Version 3 moved the index
+offset from the trailer into the header (see below), which cannot be done in place, so older
+files opened for appending keep their layout."""
+FORMAT_VERSION = 3
+MIN_FORMAT_VERSION = 1
+POINTER_VERSION = 3
+
+"""Records are copied between files verbatim, in the kernel where the platform allows it
+(copy_file_range / sendfile) and otherwise in blocks of up to COPY_BUFFER_SIZE bytes."""
+COPY_BUFFER_SIZE = 1 << 24
+
+"""Keys containing GROUP_SEPARATOR form a hierarchy: indexing a file with a prefix of existing
+keys up to a separator (e.g. f['day/2026-10-17'] for 'day/2026-10-17/bid') returns a Group
+view over the keys below it. Keys are kept sorted, so prefix queries are binary searches."""
+GROUP_SEPARATOR = '/'
+
+"""In version 3 files, the 8 bytes following the format version hold the offset of the index;
+older files end with an 8-byte trailer holding it instead. Writers only ever append, and the
+offset is updated with a single aligned write once everything it refers to has been flushed,
+so a reader never observes a partially written index and can pick up new keys while the file
+is still being written by calling refresh(). When the file is closed, the index is a binary
+table of keys and entries (see blox.index; version 1 files use a JSON object mapping keys to
+their entries instead); while the file is being written, each write instead appends a small
+JSON array of the form [prev, entry, ...] where prev is the offset of the previous such array
+or of a full index (or 0 if there is none), so the index of an unclosed file can be recovered
+by walking the chain backwards. An entry consisting of a key alone marks the key as deleted."""
+
+
+def _close_mapping(mapping):
+    try:
+        mapping.close()
+    except BufferError:
+        pass  # zero-copy views are still alive; the mapping is released along with them
+
+
+def _file_stamp(stat):
+    return stat.st_dev, stat.st_ino, getattr(stat, 'st_mtime_ns', stat.st_mtime), stat.st_size
+
+
+def _normalize_filename(filename):
+    filename = getattr(filename, 'strpath', filename)
+    return os.path.abspath(os.path.expanduser(filename))
 
 
 def is_blox(filename):
@@ -37,27 +97,56 @@ def is_blox(filename):
 
 
 class File(object):
-    def __init__(self, filename, mode=None):
-        filename = getattr(filename, 'strpath', filename)
-        filename = os.path.abspath(os.path.expanduser(filename))
+    def __init__(self, filename, mode=None, mmap=False, nthreads=None, blocksize=None,
+                 stats=False, trace=None, cache=None):
+        filename = _normalize_filename(filename)
         if mode is None:
             mode = 'r' if os.path.exists(filename) else 'r+'
         elif mode == 'w':
             mode = 'r+'
-        elif mode not in ('r', 'r+'):
-            raise ValueError('invalid mode: {!r}; expected r/r+/w'.format(mode))
+        elif mode not in ('r', 'r+', 'a'):
+            raise ValueError('invalid mode: {!r}; expected r/r+/w/a'.format(mode))
+        if mmap and mode != 'r':
+            raise ValueError('memory mapping is only supported in read mode')
+        if isinstance(stats, Stats):
+            if trace is not None:
+                raise ValueError('unable to set a trace callback on shared stats')
+            self._stats = stats
+        else:
+            self._stats = Stats(trace) if stats or trace is not None else None
+        if cache is not None and not isinstance(cache, ArrayCache):
+            cache = ArrayCache(cache)
+        self._cache = cache
+        self._identity = None
+        self._stamp = None
         self._mode = mode
+        self._nthreads = nthreads
+        self._blocksize = blocksize
         if self.writable and not os.path.exists(filename):
             io.open(filename, 'wb').close()
         self._filename = filename
         self._handle = io.open(filename, 'r' + (self.writable * '+') + 'b')
-        self._index = {}
+        self._index = SortedIndex()
         self._seek = 0
+        self._journal = 0
+        self._modified = False
+        self._batch = None
+        self._writer = None
+        self._mmap = None
+        self._index_map = None
+        self._info = {}
+        self._local = threading.local()
+        self._readers = []
         self._version = FORMAT_VERSION
         atexit.register(self.close)
         if not self.writable:
             self._version = self._try_read_and_verify_version(self._handle)
+            self._stamp = _file_stamp(os.fstat(self._handle.fileno()))
             self._read_index()
+            if mmap:
+                self._mmap = memory_map(self._handle.fileno(), 0, access=ACCESS_READ)
+        elif mode == 'a' and os.path.getsize(filename):
+            self._open_for_append()
         else:
             self._write_signature()
             self._write_index()
@@ -77,7 +166,23 @@ class File(object):
 
     @property
     def writable(self):
-        return self._mode == 'r+'
+        return self._mode in ('r+', 'a')
+
+    @property
+    def nthreads(self):
+        return self._nthreads
+
+    @property
+    def blocksize(self):
+        return self._blocksize
+
+    @property
+    def stats(self):
+        return self._stats
+
+    @property
+    def cache(self):
+        return self._cache
 
     @property
     def filesize(self):
@@ -86,18 +191,28 @@ class File(object):
     def info(self, key):
         self._check_handle()
         self._check_key(key)
-        is_array, offset = self._index[key]
-        self._handle.seek(offset)
-        if is_array:
-            meta = read_json(self._handle)
-            return {
+        entry = self._index[key]
+        if not entry[0]:
+            return {'type': 'json'}
+        info = self._info.get(key)
+        if info is None:
+            meta = entry[2] if len(entry) > 2 else read_json(self._reader(entry[1]))
+            info = {
                 'type': 'array',
                 'shape': tuple(meta['shape']),
                 'dtype': restore_dtype(meta['dtype']),
-                'compression': tuple(meta['comp'])
+                'compression': tuple(meta['comp']) if 'comp' in meta else None
             }
-        else:
-            return {'type': 'json'}
+            if 'chunks' in meta:
+                info['chunks'] = meta['chunks']
+            if 'filters' in meta:
+                info['filters'] = tuple(meta['filters'])
+            if meta.get('columnar'):
+                info['columnar'] = True
+                info['column_compression'] = dict((name, tuple(comp))
+                                                  for name, comp in meta['column_comp'])
+            self._info[key] = info
+        return dict(info)
 
     def shape(self, key):
         return self.info(key).get('shape')
@@ -106,7 +221,15 @@ class File(object):
         return self.info(key).get('dtype')
 
     def __iter__(self):
-        return iter(sorted(self._index))
+        return iter(self._index)
+
+    def keys(self, prefix=None):
+        if not prefix:
+            return list(self._index)
+        if not isinstance(prefix, six.string_types):
+            raise ValueError('invalid prefix: expected string, got {}'
+                             .format(type(prefix).__name__))
+        return list(self._index.iter_prefix(prefix))
 
     def __contains__(self, key):
         return key in self._index
@@ -114,30 +237,244 @@ class File(object):
     def __len__(self):
         return len(self._index)
 
-    def read(self, key, out=None):
+    def __getitem__(self, key):
         self._check_handle()
         self._check_key(key)
-        is_array, offset = self._index[key]
+        if key not in self._index:
+            group = key.rstrip(GROUP_SEPARATOR)
+            if group and next(self._index.iter_prefix(group + GROUP_SEPARATOR), None):
+                return Group(self, group)
+            raise KeyError(key)
+        if self._index[key][0]:
+            return Array(self, key)
+        return self.read(key)
+
+    def read(self, key, out=None, rows=None, nthreads=None, fields=None):
+        self._check_handle()
+        self._check_key(key)
+        is_array, offset = self._index[key][:2]
         if not is_array and out is not None:
             raise ValueError('can only specify output for array values')
-        self._handle.seek(offset)
+        if not is_array and rows is not None:
+            raise ValueError('can only select rows of array values')
+        if not is_array and fields is not None:
+            raise ValueError('can only select fields of array values')
+        cache_key = None
+        if is_array and self._cache is not None and out is None and fields is None:
+            cache_key = self._cache_key(key, offset)
+            # row selections are served from the cache but never stored, so they aren't misses
+            value = self._cache.get(cache_key, count_miss=rows is None)
+            if value is not None and rows is None:
+                return value
+            elif value is not None and value.ndim and isinstance(rows, slice):
+                return value[rows]
+        stream = self._reader(offset)
+        start = self._clock()
         if is_array:
-            return read_blosc(self._handle, out=out)
+            value = read_blosc(stream, out=out, rows=rows,
+                               nthreads=self._blosc_options(nthreads)[0], fields=fields)
+            self._record('read_blosc', start, stream, value.nbytes, key)
+            if cache_key is not None and rows is None:
+                value = self._cache.put(cache_key, value)
         else:
-            return read_json(self._handle)
+            value = read_json(stream)
+            self._record('read_json', start, stream, None, key)
+        return value
+
+    def iter_chunks(self, key, rows=None, out=None, nthreads=None, fields=None):
+        self._check_handle()
+        self._check_key(key)
+        is_array, offset = self._index[key][:2]
+        if not is_array:
+            raise ValueError('can only iterate over array values')
+        stream = self._reader(offset)
+        chunks = iter_blosc(stream, rows=rows, out=out, fields=fields,
+                            nthreads=self._blosc_options(nthreads)[0])
+        if self._stats is not None:
+            chunks = self._traced_chunks(key, stream, chunks)
+        return chunks
+
+    def read_many(self, keys, out=None, max_workers=None, nthreads=None):
+        self._check_handle()
+        keys = list(keys)
+        for key in keys:
+            self._check_key(key)
+            if key not in self._index:
+                raise KeyError(key)
+        out = out or {}
 
-    def write_json(self, key, data):
-        self._write(key, data, 0, write_json)
+        def read(key):
+            return self.read(key, out.get(key), nthreads=nthreads)
 
-    def write_array(self, key, data, compression='lz4', level=5, shuffle=True):
-        self._write(key, data, 1, write_blosc, compression, level, shuffle)
+        return dict(zip(keys, thread_map(read, keys, max_workers)))
+
+    def write_json(self, key, data, overwrite=False):
+        self._check_handle(write=True)
+        self._check_key(key, write=True, overwrite=overwrite)
+        start = self._clock()
+        length = self._write(key, 0, None, write_json, data)
+        self._record('write_json', start, length, length, key)
+
+    def write_array(self, key, data, compression='lz4', level=5, shuffle=True, chunks=None,
+                    nthreads=None, blocksize=None, overwrite=False, filters=None,
+                    columnar=False):
+        self._check_handle(write=True)
+        self._check_key(key, write=True, overwrite=overwrite)
+        start = self._clock()
+        meta, frames = pack_blosc(data, compression, level, shuffle, chunks,
+                                  *self._blosc_options(nthreads, blocksize), filters=filters,
+                                  columnar=columnar)
+        length = self._write(key, 1, meta, write_packed, meta, frames)
+        self._record('write_blosc', start, length, meta['size'], key)
+
+    def write_many(self, arrays, compression='lz4', level=5, shuffle=True, chunks=None,
+                   max_workers=None, nthreads=None, blocksize=None, overwrite=False,
+                   filters=None, columnar=False):
+        self._check_handle(write=True)
+        items = list(arrays.items() if hasattr(arrays, 'items') else arrays)
+        for key, _ in items:
+            self._check_key(key, write=True, overwrite=overwrite)
+        if len(set(key for key, _ in items)) != len(items):
+            raise ValueError('duplicate keys')
+
+        def pack(item):
+            start = self._clock()
+            meta, frames = pack_blosc(item[1], compression, level, shuffle, chunks,
+                                      *self._blosc_options(nthreads, blocksize), filters=filters,
+                                      columnar=columnar)
+            return meta, frames, self._clock() - start
+
+        with self.batch():
+            for (key, _), (meta, frames, elapsed) in zip(items,
+                                                         thread_map(pack, items, max_workers)):
+                start = self._clock() - elapsed
+                length = self._write(key, 1, meta, write_packed, meta, frames)
+                self._record('write_blosc', start, length, meta['size'], key)
+
+    def array_writer(self, key, dtype, shape=None, chunk_rows=None, compression='lz4', level=5,
+                     shuffle=True, nthreads=None, blocksize=None, overwrite=False,
+                     filters=None):
+        self._check_handle(write=True)
+        self._check_key(key, write=True, overwrite=overwrite)
+        if self._batch is not None:
+            raise IOError('unable to stream an array inside a batch')
+        self._writer = ArrayWriter(self, key, dtype, shape, chunk_rows,
+                                   (compression, level, shuffle),
+                                   self._blosc_options(nthreads, blocksize), filters)
+        return self._writer
+
+    def copy_from(self, other, keys=None, overwrite=False):
+        self._check_handle(write=True)
+        if not isinstance(other, File):
+            with File(other, 'r') as other:
+                return self.copy_from(other, keys, overwrite)
+        other._check_handle()
+        if other is self or other.filename == self.filename:
+            raise ValueError('unable to copy a file into itself')
+        keys = list(other) if keys is None else list(keys)
+        for key in keys:
+            other._check_key(key)
+            if key not in other._index:
+                raise KeyError(key)
+            self._check_key(key, write=True, overwrite=overwrite)
+        if len(set(keys)) != len(keys):
+            raise ValueError('duplicate keys')
+        with self.batch():
+            for key in sorted(keys, key=lambda key: other._index[key][1]):
+                self._copy_record(other, key)
+
+    def delete(self, key):
+        self._check_handle(write=True)
+        self._check_key(key)
+        if key not in self._index:
+            raise KeyError(key)
+        del self._index[key]
+        self._info.pop(key, None)
+        self._log([key])
+
+    def repack(self):
+        self._check_handle(write=True)
+        if self._batch is not None:
+            raise IOError('unable to repack inside a batch')
+        self._handle.flush()
+        size = os.path.getsize(self._filename)
+        if self._modified:
+            self._write_index()
+            self._handle.flush()
+        filename = self._filename + '.repack'
+        try:
+            repack(self._filename, filename)
+            reclaimed = size - os.path.getsize(filename)
+            self._handle.close()
+            getattr(os, 'replace', os.rename)(filename, self._filename)
+        finally:
+            if os.path.exists(filename):
+                os.remove(filename)
+        self._close_readers()
+        self._handle = io.open(self._filename, 'r+b')
+        self._info = {}
+        self._identity = None
+        self._modified = False
+        self._open_for_append()
+        return reclaimed
+
+    @contextlib.contextmanager
+    def batch(self):
+        self._check_handle(write=True)
+        if self._batch is not None:
+            yield self
+            return
+        self._batch = []
+        try:
+            yield self
+        finally:
+            entries, self._batch = self._batch, None
+            if entries:
+                self._write_journal(*entries)
+            self._handle.flush()
+
+    def refresh(self):
+        self._check_handle()
+        if self.writable:
+            return
+        stat, current = os.stat(self._filename), os.fstat(self._handle.fileno())
+        if (stat.st_dev, stat.st_ino) != (current.st_dev, current.st_ino):
+            handle = io.open(self._filename, 'rb')
+            try:
+                version = self._try_read_and_verify_version(handle)
+            except:
+                handle.close()
+                raise
+            self._close_readers()
+            self._handle.close()
+            self._handle, self._version = handle, version
+        else:
+            self._handle.seek(0, os.SEEK_END)  # seeking from the end discards the read buffer
+            if self._read_pointer(self._handle) == self._journal and \
+                    _file_stamp(stat) == self._stamp:
+                return
+        # the file may have been rewritten in place, reusing offsets of cached arrays
+        self._stamp = _file_stamp(stat)
+        self._identity = None
+        self._info = {}
+        self._read_index()
+        if self._mmap is not None:
+            self._unmap()
+            self._mmap = memory_map(self._handle.fileno(), 0, access=ACCESS_READ)
 
     def close(self):
+        if self._writer is not None:
+            self._writer.abort()
+        self._unmap()
+        self._close_readers()
         if self._handle is not None:
-            if self.writable:
+            if self.writable and self._modified:
+                self._write_index()
                 self._handle.flush()
             self._handle.close()
         self._handle = None
+        self._index = SortedIndex()
+        self._close_index_map()
 
     def __enter__(self):
         return self
@@ -153,54 +490,486 @@ class File(object):
             version = read_i64(byte_stream)
         except:
             raise IOError('unable to read file version')
-        if version != FORMAT_VERSION:  # this could be later relaxed to a range of versions
+        if not MIN_FORMAT_VERSION <= version <= FORMAT_VERSION:
             raise IOError('incompatible version: {} (expected {})'.format(version, FORMAT_VERSION))
         return version
 
     def _write_signature(self):
         self._handle.seek(0)
         self._handle.write(FORMAT_STRING)
-        write_i64(self._handle, FORMAT_VERSION)
-        self._seek = 16
+        write_i64(self._handle, FORMAT_VERSION, 0)
+        self._seek = 24
 
-    def _write(self, key, data, is_array, func, *args, **kwargs):
+    def _write(self, key, is_array, meta, func, *args):
         self._check_handle(write=True)
-        self._check_key(key, write=True)
-        self._index[key] = [is_array, self._seek]
         self._handle.seek(self._seek)
         try:
-            self._seek += func(self._handle, data, *args, **kwargs)
+            length = func(self._handle, *args)
         except:
-            self._index.pop(key)
-            self._write_index()
+            self._discard()
             six.reraise(*sys.exc_info())
+        entry = [is_array, self._seek]
+        if meta is not None:
+            entry.append(dict((k, v) for k, v in meta.items() if k not in ('offsets', 'columns')))
+        self._index[key] = entry
+        self._info.pop(key, None)
+        self._seek += length
+        self._log([key] + entry)
+        return length
+
+    def _log(self, entry):
+        if self._batch is None:
+            self._write_journal(entry)
         else:
-            self._write_index()
+            self._batch.append(entry)
+
+    def _copy_record(self, source, key):
+        clock = self._clock()
+        start, stop, offset = source._extent(key)
+        copied = 0
+        if source._mmap is None:
+            if source.writable:
+                source._handle.flush()
+            self._handle.flush()
+            copied = copy_range(source._handle.fileno(), self._handle.fileno(),
+                                start, self._seek, stop - start)
+        self._handle.seek(self._seek + copied)
+        stream = source._reader(start + copied)
+        remaining = stop - start - copied
+        while remaining:
+            data = stream.read(min(remaining, COPY_BUFFER_SIZE))
+            if not data:
+                raise IOError('unexpected end of file: {!r}'.format(source.filename))
+            self._handle.write(data)
+            remaining -= len(data)
+        entry = list(source._index[key])
+        entry[1] = self._seek + offset - start
+        self._index[key] = entry
+        self._info.pop(key, None)
+        self._seek += stop - start
+        self._log([key] + entry)
+        self._record('copy', clock, stop - start, stop - start, key)
+
+    def _extent(self, key):
+        entry = self._index[key]
+        stream = self._reader(entry[1])
+        if not entry[0]:
+            return entry[1], entry[1] + 8 + read_i64(stream), entry[1]
+        meta = read_json(stream)
+        end = stream.tell()
+        if 'prefix' in meta:
+            return entry[1] - meta['prefix'], end, entry[1]
+        return entry[1], end + meta['length'], entry[1]
+
+    def _open_for_append(self):
+        self._version = self._try_read_and_verify_version(self._handle)
+        self._read_index()
+        if self._version == 1:
+            self._handle.seek(len(FORMAT_STRING))
+            write_i64(self._handle, 2)
+            self._version = 2
+            self._modified = True
+        self._seek = self._handle.seek(0, os.SEEK_END)
+
+    def _reader(self, offset):
+        if self._mmap is not None:
+            return BufferStream(self._mmap, offset)
+        if self.writable:
+            self._handle.flush()
+        if hasattr(os, 'pread'):
+            return PositionalStream(self._handle.fileno(), offset)
+        handle = getattr(self._local, 'handle', None)
+        if handle is None:
+            handle = self._local.handle = io.open(self._filename, 'rb')
+            self._readers.append(handle)
+        handle.seek(offset)
+        return handle if self._stats is None else CountingStream(handle)
 
     def _read_index(self):
+        start = self._clock()
+        handle = self._handle if self._stats is None else CountingStream(self._handle)
+        index_map, self._index_map = self._index_map, None
         try:
-            self._handle.seek(-8, os.SEEK_END)
-            self._handle.seek(read_i64(self._handle))
-            self._index = read_json(self._handle)
+            offset = self._journal = self._read_pointer(handle)
+            journal, index = [], {}
+            while offset:
+                handle.seek(offset)
+                if is_binary_index(handle):
+                    index = self._read_binary_index(handle, offset)
+                    break
+                entries = read_json(handle)
+                if isinstance(entries, dict):
+                    index = entries
+                    break
+                offset = entries[0]
+                journal.append(entries[1:])
+            if journal or self.writable or not isinstance(index, BinaryIndex):
+                index = SortedIndex(index.items())
+            for entries in reversed(journal):
+                for entry in entries:
+                    if len(entry) == 1:
+                        index.pop(entry[0], None)
+                    else:
+                        index[entry[0]] = entry[1:]
+            self._index = index
         except:
+            self._close_index_map()
+            self._index_map = index_map
             raise IOError('unable to read index')
+        if not isinstance(self._index, BinaryIndex):
+            self._close_index_map()
+        if index_map is not None:
+            _close_mapping(index_map)
+        self._record('read_index', start, handle, None)
+
+    def _read_binary_index(self, handle, offset):
+        if self.writable:
+            size = read_index_size(handle)
+            handle.seek(offset)
+            return BinaryIndex(handle.read(size))
+        self._index_map = memory_map(self._handle.fileno(), 0, access=ACCESS_READ)
+        return BinaryIndex(self._index_map, offset)
+
+    def _write_journal(self, *entries):
+        start = self._clock()
+        self._handle.seek(self._seek)
+        length = write_json(self._handle, [self._journal] + list(entries))
+        self._modified = True
+        self._publish(self._seek)
+        self._seek += length
+        self._record('write_index', start, length + 8, length + 8)
 
     def _write_index(self):
+        start = self._clock()
+        self._handle.seek(self._seek)
         self._handle.truncate()
-        write_json(self._handle, self._index)
-        write_i64(self._handle, self._seek)
+        length = write_binary_index(self._handle, self._index)
+        self._publish(self._seek)
+        self._seek += length
+        self._record('write_index', start, length + 8, length + 8)
+
+    def _publish(self, offset):
+        self._journal = offset
+        if self._version < POINTER_VERSION:
+            self._write_trailer()
+            return
+        self._handle.flush()
+        if hasattr(os, 'pwrite'):
+            os.pwrite(self._handle.fileno(), struct.pack('<Q', offset), 16)
+        else:
+            self._handle.seek(16)
+            write_i64(self._handle, offset)
+            self._handle.flush()
+
+    def _discard(self):
+        self._handle.seek(self._seek)
+        self._handle.truncate()
+        self._write_trailer()
+
+    def _write_trailer(self):
+        if self._version < POINTER_VERSION:
+            write_i64(self._handle, self._journal)
+
+    def _read_pointer(self, handle):
+        if self._version < POINTER_VERSION:
+            handle.seek(-8, os.SEEK_END)
+        else:
+            handle.seek(16)
+        return read_i64(handle)
+
+    def _close_index_map(self):
+        if self._index_map is not None:
+            _close_mapping(self._index_map)
+            self._index_map = None
+
+    def _unmap(self):
+        if self._mmap is not None:
+            _close_mapping(self._mmap)
+            self._mmap = None
+
+    def _close_readers(self):
+        for reader in self._readers:
+            reader.close()
+        self._readers, self._local = [], threading.local()
+
+    def _cache_key(self, key, offset):
+        if self._identity is None:
+            # in read mode, describe the file as it was when the index was loaded
+            self._identity = self._stamp or _file_stamp(os.fstat(self._handle.fileno()))
+        return self._identity + (key, offset)
+
+    def _clock(self):
+        return 0 if self._stats is None else self._stats.clock()
+
+    def _record(self, phase, start, nbytes, raw_nbytes, key=None):
+        if self._stats is not None:
+            if not isinstance(nbytes, numbers.Integral):
+                nbytes = nbytes.count
+            self._stats.record(phase, self._stats.clock() - start, nbytes,
+                               nbytes if raw_nbytes is None else raw_nbytes, key)
+
+    def _traced_chunks(self, key, stream, chunks):
+        while True:
+            start, count = self._clock(), stream.count
+            try:
+                block = next(chunks)
+            except StopIteration:
+                return
+            self._record('read_blosc', start, stream.count - count, block.nbytes, key)
+            yield block
+
+    def _blosc_options(self, nthreads=None, blocksize=None):
+        return (self._nthreads if nthreads is None else nthreads,
+                self._blocksize if blocksize is None else blocksize)
 
     def _check_handle(self, write=False):
         if self._handle is None:
             raise IOError('the file handle has been closed')
         if write and not self.writable:
             raise IOError('the file is not writable')
+        if write and self._writer is not None:
+            raise IOError('an array writer is active: {!r}'.format(self._writer.key))
 
-    def _check_key(self, key, write=False):
+    def _check_key(self, key, write=False, overwrite=False):
         if not isinstance(key, six.string_types):
             raise ValueError('invalid key: expected string, got {}'.format(type(key).__name__))
         if write:
             if not key:
                 raise ValueError('invalid key: empty string')
-            if key in self._index:
+            if key in self._index and not overwrite:
                 raise ValueError('key already exists: {!r}'.format(key))
+
+
+def repack(src, dst):
+    if _normalize_filename(src) == _normalize_filename(dst):
+        raise ValueError('unable to repack a file into itself')
+    with File(dst, 'w') as target:
+        target.copy_from(src)
+    return os.path.getsize(src) - os.path.getsize(dst)
+
+
+def merge(inputs, output, overwrite=False):
+    inputs = list(inputs)
+    if _normalize_filename(output) in map(_normalize_filename, inputs):
+        raise ValueError('unable to merge a file into itself')
+    with File(output, 'w') as target:
+        for filename in inputs:
+            target.copy_from(filename, overwrite=overwrite)
+
+
+class Array(object):
+    def __init__(self, file, key):
+        self._file = file
+        self._key = key
+
+    @property
+    def key(self):
+        return self._key
+
+    @property
+    def shape(self):
+        return self._file.shape(self._key)
+
+    @property
+    def dtype(self):
+        return self._file.dtype(self._key)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        shape = self.shape
+        if not shape:
+            raise TypeError('len() of unsized object')
+        return shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        data = self._file.read(self._key)
+        return data if dtype is None else data.astype(dtype)
+
+    def __getitem__(self, index):
+        if not isinstance(index, tuple):
+            index = (index,)
+        if not index or not self.ndim:
+            return self._file.read(self._key)[index]
+        first, rest = index[0], index[1:]
+        if isinstance(first, slice):
+            return self._file.read(self._key, rows=first)[(slice(None),) + rest]
+        if isinstance(first, numbers.Integral) and not isinstance(first, bool):
+            length = len(self)
+            row = int(first) + length if first < 0 else int(first)
+            if not 0 <= row < length:
+                raise IndexError('index {} is out of bounds for axis 0 with size {}'
+                                 .format(first, length))
+            return self._file.read(self._key, rows=slice(row, row + 1))[(0,) + rest]
+        return self._file.read(self._key)[index]
+
+    def __repr__(self):
+        return '<blox.Array {!r}: shape {}, dtype {}>'.format(self._key, self.shape, self.dtype)
+
+
+class Group(object):
+    def __init__(self, file, name):
+        self._file = file
+        self._name = name
+        self._prefix = name + GROUP_SEPARATOR
+
+    @property
+    def file(self):
+        return self._file
+
+    @property
+    def name(self):
+        return self._name
+
+    def keys(self, prefix=None):
+        if prefix is not None and not isinstance(prefix, six.string_types):
+            raise ValueError('invalid prefix: expected string, got {}'
+                             .format(type(prefix).__name__))
+        return [key[len(self._prefix):]
+                for key in self._file.keys(self._prefix + (prefix or ''))]
+
+    def read(self, key, *args, **kwargs):
+        self._file._check_key(key)
+        return self._file.read(self._prefix + key, *args, **kwargs)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, key):
+        return isinstance(key, six.string_types) and self._prefix + key in self._file
+
+    def __getitem__(self, key):
+        self._file._check_key(key)
+        return self._file[self._prefix + key]
+
+    def __repr__(self):
+        return '<blox.Group {!r}: {} keys>'.format(self._name, len(self))
+
+
+class ArrayWriter(object):
+    def __init__(self, file, key, dtype, shape, chunk_rows, comp, options, filters=None):
+        self._file = file
+        self._key = key
+        self._dtype = np.dtype(dtype)
+        if self._dtype == np.dtype('O'):
+            raise ValueError('unable to serialize: invalid dtype')
+        self._shape = None if shape is None else tuple(shape)
+        self._chunk_rows = chunk_rows
+        self._target = auto_target(comp[0])
+        self._comp = None if self._target else normalize_compression(*comp)
+        self._level = comp[1]
+        self._filters = normalize_filters(filters, self._dtype)
+        self._options = options
+        self._rows = 0
+        self._buffer = None
+        self._filled = 0
+        self._lengths = []
+        self._start = file._seek
+        self._length = 0
+        if self._shape is not None:
+            self._allocate()
+
+    @property
+    def key(self):
+        return self._key
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def shape(self):
+        return None if self._shape is None else (self._rows,) + self._shape
+
+    def append(self, data):
+        self._check_active()
+        data = np.asarray(data, dtype=self._dtype)
+        if not data.ndim:
+            raise ValueError('expected at least one-dimensional array')
+        if self._shape is None:
+            self._shape = data.shape[1:]
+            self._allocate()
+        elif data.shape[1:] != self._shape:
+            raise ValueError('incompatible shape: expected (n,) + {}, got {}'
+                             .format(self._shape, data.shape))
+        while len(data):
+            count = min(len(data), self._chunk_rows - self._filled)
+            self._buffer[self._filled:self._filled + count] = data[:count]
+            self._filled += count
+            self._rows += count
+            data = data[count:]
+            if self._filled == self._chunk_rows:
+                self._flush()
+
+    def close(self):
+        if self._file is None:
+            return
+        if self._shape is None:
+            self._shape = ()
+            self._allocate()
+        if self._filled:
+            self._flush()
+        if self._comp is None:
+            self._comp = select_compression(self._buffer[:0], self._target, self._level,
+                                            self._filters)
+        file, self._file = self._file, None
+        file._writer = None
+        meta = make_meta((self._rows,) + self._shape, self._dtype, self._comp,
+                         self._chunk_rows, self._lengths, self._filters)
+        meta['prefix'] = self._length
+        self._buffer = None
+        file._seek = self._start + self._length
+        start = file._clock()
+        length = file._write(self._key, 1, meta, write_json, meta)
+        file._record('write_blosc', start, length, 0, self._key)
+
+    def abort(self):
+        if self._file is None:
+            return
+        file, self._file = self._file, None
+        file._writer = None
+        self._buffer = None
+        file._discard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _check_active(self):
+        if self._file is None:
+            raise IOError('the array writer has been closed')
+
+    def _allocate(self):
+        shape = (0,) + self._shape
+        if self._chunk_rows is None:
+            self._chunk_rows = default_chunks(shape, self._dtype)
+        self._chunk_rows = check_chunks(self._chunk_rows, shape, self._dtype)
+        self._buffer = np.empty((self._chunk_rows,) + self._shape, self._dtype)
+
+    def _flush(self):
+        start = self._file._clock()
+        with blosc_options(*self._options):
+            if self._comp is None:
+                self._comp = select_compression(self._buffer[:self._filled], self._target,
+                                                self._level, self._filters)
+            frame = compress_frame(self._buffer[:self._filled], *self._comp,
+                                   filters=self._filters)
+        handle = self._file._handle
+        handle.seek(self._start + self._length)
+        handle.write(frame)
+        self._file._write_trailer()
+        self._length += len(frame)
+        self._lengths.append(len(frame))
+        self._file._record('write_blosc', start, len(frame), self._buffer[:self._filled].nbytes,
+                           self._key)
+        self._filled = 0
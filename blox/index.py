@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import six
+import bisect
+import numpy as np
+
+try:
+    from collections.abc import Mapping, MutableMapping
+except ImportError:
+    from collections import Mapping, MutableMapping
+
+from blox.utils import read_i64, write_i64, json, json_dumps
+
+
+"""A binary index starts with INDEX_SIGNATURE (which can never be mistaken for the length
+prefix of a JSON record since it would exceed any possible file size), followed by the number
+of keys and the sizes of the key and metadata blobs. Then comes a table with one row of four
+little-endian 64-bit integers per key -- end of the key in the key blob, record offset, end
+of the array metadata in the metadata blob (empty for JSON values) and the array flag --
+followed by the UTF-8 keys in sorted order and the JSON-encoded array metadata. Keys are
+looked up by binary search directly in the (typically memory-mapped) buffer."""
+INDEX_SIGNATURE = b'\211BLXIDX\377'
+INDEX_HEADER_SIZE = 32
+INDEX_COLUMNS = 4
+
+
+def is_binary_index(stream):
+    offset = stream.tell()
+    signature = stream.read(8)
+    stream.seek(offset)
+    return bytes(signature) == INDEX_SIGNATURE
+
+
+def read_index_size(stream):
+    if bytes(stream.read(8)) != INDEX_SIGNATURE:
+        raise IOError('invalid index signature')
+    count, keys_size, meta_size = read_i64(stream, 3)
+    return INDEX_HEADER_SIZE + count * INDEX_COLUMNS * 8 + keys_size + meta_size
+
+
+def write_binary_index(stream, index):
+    items = sorted((key.encode('utf-8'), entry) for key, entry in index.items())
+    keys = [key for key, _ in items]
+    metas = [json_dumps(entry[2]).encode('utf-8') if len(entry) > 2 else b''
+             for _, entry in items]
+    table = np.empty((len(items), INDEX_COLUMNS), '<u8')
+    table[:, 0] = np.cumsum([len(key) for key in keys], dtype=np.int64)
+    table[:, 1] = [entry[1] for _, entry in items]
+    table[:, 2] = np.cumsum([len(meta) for meta in metas], dtype=np.int64)
+    table[:, 3] = [entry[0] for _, entry in items]
+    keys, metas = b''.join(keys), b''.join(metas)
+    stream.write(INDEX_SIGNATURE)
+    write_i64(stream, len(items), len(keys), len(metas))
+    stream.write(table.tobytes())
+    stream.write(keys)
+    stream.write(metas)
+    return INDEX_HEADER_SIZE + table.nbytes + len(keys) + len(metas)
+
+
+class BinaryIndex(Mapping):
+    def __init__(self, buffer, offset=0):
+        if bytes(buffer[offset:offset + 8]) != INDEX_SIGNATURE:
+            raise IOError('invalid index signature')
+        count, keys_size, meta_size = np.frombuffer(buffer, '<u8', 3, offset + 8).tolist()
+        self._buffer = buffer
+        self._count = count
+        self._table = np.frombuffer(buffer, '<u8', count * INDEX_COLUMNS,
+                                    offset + INDEX_HEADER_SIZE).reshape(count, INDEX_COLUMNS)
+        self._keys = offset + INDEX_HEADER_SIZE + self._table.nbytes
+        self._metas = self._keys + keys_size
+        self._entries = {}
+
+    def _key(self, index):
+        start = int(self._table[index - 1, 0]) if index else 0
+        return bytes(self._buffer[self._keys + start:self._keys + int(self._table[index, 0])])
+
+    def _bisect(self, key):
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _find(self, key):
+        if not isinstance(key, six.string_types):
+            return -1
+        key = key.encode('utf-8')
+        index = self._bisect(key)
+        return index if index < self._count and self._key(index) == key else -1
+
+    def iter_prefix(self, prefix):
+        prefix = prefix.encode('utf-8')
+        for index in range(self._bisect(prefix), self._count):
+            key = self._key(index)
+            if not key.startswith(prefix):
+                break
+            yield key.decode('utf-8')
+
+    def _entry(self, index):
+        entry = self._entries.get(index)
+        if entry is None:
+            _, offset, end, is_array = self._table[index].tolist()
+            entry = [is_array, offset]
+            start = int(self._table[index - 1, 2]) if index else 0
+            if end > start:
+                meta = bytes(self._buffer[self._metas + start:self._metas + end])
+                entry.append(json.loads(meta.decode('utf-8')))
+            self._entries[index] = entry
+        return entry
+
+    def __getitem__(self, key):
+        index = self._find(key)
+        if index < 0:
+            raise KeyError(key)
+        return self._entry(index)
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self._key(index).decode('utf-8')
+
+    def __len__(self):
+        return self._count
+
+    def items(self):
+        return [(key, self._entry(index)) for index, key in enumerate(self)]
+
+
+class SortedIndex(MutableMapping):
+    def __init__(self, items=()):
+        self._entries = dict(items)
+        self._keys = sorted(self._entries)
+
+    def __getitem__(self, key):
+        return self._entries[key]
+
+    def __setitem__(self, key, entry):
+        if key not in self._entries:
+            bisect.insort(self._keys, key)
+        self._entries[key] = entry
+
+    def __delitem__(self, key):
+        del self._entries[key]
+        del self._keys[bisect.bisect_left(self._keys, key)]
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def items(self):
+        return [(key, self._entries[key]) for key in self._keys]
+
+    def iter_prefix(self, prefix):
+        for index in range(bisect.bisect_left(self._keys, prefix), len(self._keys)):
+            key = self._keys[index]
+            if not key.startswith(prefix):
+                break
+            yield key
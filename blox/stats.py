@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import threading
+
+from timeit import default_timer
+
+
+"""Phases timed by File when statistics are enabled: reading and writing array and JSON
+records (array phases include (de)compression), raw record copies, and reading or writing
+the index (including journal entries). 'bytes' counts bytes read from or written to the
+file, 'raw_bytes' the corresponding uncompressed sizes."""
+READ_PHASES = ('read_blosc', 'read_json', 'read_index')
+WRITE_PHASES = ('write_blosc', 'write_json', 'write_index', 'copy')
+PHASES = READ_PHASES + WRITE_PHASES
+
+
+class Stats(object):
+    """I/O counters collected by File(..., stats=True); an optional trace callback is invoked
+    as trace(phase, key, elapsed, nbytes, raw_nbytes) after every recorded operation. A single
+    instance may be shared between several files."""
+
+    clock = staticmethod(default_timer)
+
+    def __init__(self, trace=None):
+        self.trace = trace
+        self._lock = threading.Lock()
+        self._phases = {}
+
+    def reset(self):
+        with self._lock:
+            self._phases = {}
+
+    def record(self, phase, elapsed, nbytes=0, raw_nbytes=0, key=None):
+        with self._lock:
+            counters = self._phases.get(phase)
+            if counters is None:
+                counters = self._phases[phase] = [0, 0.0, 0, 0]
+            counters[0] += 1
+            counters[1] += elapsed
+            counters[2] += nbytes
+            counters[3] += raw_nbytes
+        if self.trace is not None:
+            self.trace(phase, key, elapsed, nbytes, raw_nbytes)
+
+    def phase(self, name):
+        if name not in PHASES:
+            raise ValueError('unknown phase: {!r}'.format(name))
+        with self._lock:
+            calls, time, nbytes, raw_nbytes = self._phases.get(name, (0, 0.0, 0, 0))
+        return {'calls': calls, 'time': time, 'bytes': nbytes, 'raw_bytes': raw_nbytes}
+
+    @property
+    def phases(self):
+        return dict((name, self.phase(name)) for name in PHASES)
+
+    @property
+    def calls(self):
+        return sum(self.phase(name)['calls'] for name in PHASES)
+
+    @property
+    def time(self):
+        return sum(self.phase(name)['time'] for name in PHASES)
+
+    @property
+    def bytes_read(self):
+        return sum(self.phase(name)['bytes'] for name in READ_PHASES)
+
+    @property
+    def bytes_written(self):
+        return sum(self.phase(name)['bytes'] for name in WRITE_PHASES)
+
+    @property
+    def raw_bytes_read(self):
+        return sum(self.phase(name)['raw_bytes'] for name in READ_PHASES)
+
+    @property
+    def raw_bytes_written(self):
+        return sum(self.phase(name)['raw_bytes'] for name in WRITE_PHASES)
+
+    def as_dict(self):
+        result = self.phases
+        result.update(calls=self.calls, time=self.time,
+                      bytes_read=self.bytes_read, bytes_written=self.bytes_written,
+                      raw_bytes_read=self.raw_bytes_read,
+                      raw_bytes_written=self.raw_bytes_written)
+        return result
+
+    def __repr__(self):
+        return '<blox.Stats: {} calls, {} bytes read, {} bytes written, {:.6f}s>'.format(
+            self.calls, self.bytes_read, self.bytes_written, self.time)
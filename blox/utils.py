@@ -2,10 +2,14 @@
 
 from __future__ import absolute_import
 
+import os
 import six
 import struct
 import functools
+import collections
 import numpy as np
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
 try:
     import ujson as json
@@ -32,6 +36,9 @@ def restore_dtype(dtype):
         if isinstance(dt, list):
             if len(dt) == 2 and is_string(dt[0]):
                 return _convert_dtype(tuple(dt))
+            if len(dt) == 3 and is_string(dt[0]) and isinstance(dt[2], (list, int)):
+                shape = tuple(dt[2]) if isinstance(dt[2], list) else dt[2]
+                return _convert_dtype(tuple(dt[:2])) + (shape,)
             return [_convert_dtype(subdt) for subdt in dt]
         elif isinstance(dt, tuple):
             return tuple(_convert_dtype(subdt) for subdt in dt)
@@ -64,4 +71,158 @@ def write_json(stream, data):
 
 def read_json(stream):
     length = read_i64(stream)
-    return json.loads(stream.read(length).decode('utf-8'))
+    payload = stream.read(length)
+    if isinstance(payload, memoryview):
+        payload = payload.tobytes()
+    return json.loads(payload.decode('utf-8'))
+
+
+def thread_map(func, iterable, max_workers=None):
+    if max_workers == 1:
+        for item in iterable:
+            yield func(item)
+        return
+    max_workers = max_workers or cpu_count()
+    pool = ThreadPool(max_workers)
+    pending = collections.deque()
+    try:
+        # keep a bounded number of tasks in flight so that a slow consumer doesn't cause all
+        # of the results to pile up in memory
+        for item in iterable:
+            pending.append(pool.apply_async(func, (item,)))
+            if len(pending) > 2 * max_workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def copy_range(src_fd, dst_fd, src_offset, dst_offset, count):
+    copied = 0
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while copied < count:
+                size = os.copy_file_range(src_fd, dst_fd, count - copied,
+                                          src_offset + copied, dst_offset + copied)
+                if not size:
+                    break
+                copied += size
+            return copied
+        except OSError:
+            pass
+    if hasattr(os, 'sendfile'):
+        try:
+            os.lseek(dst_fd, dst_offset + copied, os.SEEK_SET)
+            while copied < count:
+                size = os.sendfile(dst_fd, src_fd, src_offset + copied, count - copied)
+                if not size:
+                    break
+                copied += size
+        except OSError:
+            pass
+    return copied
+
+
+class BufferStream(object):
+    def __init__(self, buffer, offset=0):
+        self._buffer = memoryview(buffer)
+        self._offset = offset
+        self.count = 0
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._offset
+        elif whence == 2:
+            offset += len(self._buffer)
+        self._offset = offset
+        return offset
+
+    def tell(self):
+        return self._offset
+
+    def read(self, size=-1):
+        start = min(self._offset, len(self._buffer))
+        stop = len(self._buffer)
+        if size is not None and size >= 0:
+            stop = min(start + size, stop)
+        self._offset = stop
+        self.count += stop - start
+        return self._buffer[start:stop]
+
+    def readinto(self, buffer):
+        view = memoryview(buffer)
+        data = self.read(view.nbytes)
+        view[:len(data)] = data
+        return len(data)
+
+
+class PositionalStream(object):
+    def __init__(self, fd, offset=0):
+        self._fd = fd
+        self._offset = offset
+        self.count = 0
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._offset
+        elif whence == 2:
+            offset += os.fstat(self._fd).st_size
+        self._offset = offset
+        return offset
+
+    def tell(self):
+        return self._offset
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = max(os.fstat(self._fd).st_size - self._offset, 0)
+        parts = []
+        while size > 0:
+            part = os.pread(self._fd, size, self._offset)
+            if not part:
+                break
+            parts.append(part)
+            size -= len(part)
+            self._offset += len(part)
+            self.count += len(part)
+        return parts[0] if len(parts) == 1 else b''.join(parts)
+
+    def readinto(self, buffer):
+        view = memoryview(buffer)
+        if not hasattr(os, 'preadv'):
+            data = self.read(view.nbytes)
+            view[:len(data)] = data
+            return len(data)
+        total = 0
+        while total < view.nbytes:
+            count = os.preadv(self._fd, [view[total:]], self._offset)
+            if not count:
+                break
+            total += count
+            self._offset += count
+        self.count += total
+        return total
+
+
+class CountingStream(object):
+    def __init__(self, stream):
+        self._stream = stream
+        self.count = 0
+
+    def seek(self, offset, whence=0):
+        return self._stream.seek(offset, whence)
+
+    def tell(self):
+        return self._stream.tell()
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        self.count += len(data)
+        return data
+
+    def readinto(self, buffer):
+        count = self._stream.readinto(buffer)
+        self.count += count
+        return count
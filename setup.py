@@ -37,6 +37,7 @@ setup(
         'numpy', 'blosc', 'six'
     ],
     extras_require={
-        'extras': ['ujson']
+        'extras': ['ujson'],
+        'codecs': ['zstandard', 'lz4']
     }
 )
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+import time
+import pytest
+import numpy as np
+from pytest import raises_regexp
+
+from blox import File, AsyncFile
+
+asyncio = pytest.importorskip('asyncio')
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    loop.close()
+    asyncio.set_event_loop(None)
+
+
+@pytest.fixture
+def tmpfile(tmpdir):
+    return tmpdir.join('file.tmp').strpath
+
+
+class TestAsyncFile(object):
+    def test_gather(self, tmpfile, loop):
+        arrays = dict(('a{}'.format(i), np.arange(i * 1000)) for i in range(20))
+        af = AsyncFile(tmpfile, 'w', max_workers=4)
+        assert af.writable and af.filename == tmpfile
+        loop.run_until_complete(asyncio.gather(
+            *[af.write_array(key, arr, chunks=100) for key, arr in arrays.items()] +
+            [af.write_json('j', {'foo': 1})]))
+        loop.run_until_complete(af.delete('a0'))
+        loop.run_until_complete(af.close())
+        with AsyncFile(tmpfile) as af:
+            assert not af.writable and len(af) == 20 and 'a0' not in af and 'j' in af
+            assert af.keys('a1') == ['a1'] + ['a1{}'.format(i) for i in range(10)]
+            keys = sorted(arrays)[1:]
+            values = loop.run_until_complete(asyncio.gather(*[af.read(key) for key in keys]))
+            for key, value in zip(keys, values):
+                np.testing.assert_array_equal(value, arrays[key])
+            assert loop.run_until_complete(af.read('j')) == {'foo': 1}
+            np.testing.assert_array_equal(
+                loop.run_until_complete(af.read('a5', rows=slice(10, 20))), np.arange(10, 20))
+            assert af.info('a5')['shape'] == (5000,)
+            with raises_regexp(KeyError, 'foo'):
+                loop.run_until_complete(af.read('foo'))
+
+    def test_context_manager(self, tmpfile, loop):
+        af = AsyncFile(tmpfile, 'w')
+        assert loop.run_until_complete(af.__aenter__()) is af
+        loop.run_until_complete(af.write_json('a', 1))
+        assert loop.run_until_complete(af.__aexit__(None, None, None)) is None
+        assert af.file._handle is None
+        with File(tmpfile) as f:
+            assert f.read('a') == 1
+
+    def test_loop_not_blocked(self, tmpfile, loop, monkeypatch):
+        with File(tmpfile, 'w') as f:
+            f.write_array('a', np.arange(10))
+        af = AsyncFile(tmpfile, max_workers=2)
+        read = af.file.read
+        monkeypatch.setattr(af.file, 'read', lambda *args, **kwargs: time.sleep(0.2) or
+                            read(*args, **kwargs))
+        ticks = []
+
+        def tick():
+            ticks.append(time.time())
+            if len(ticks) < 10:
+                loop.call_later(0.01, tick)
+
+        loop.call_soon(tick)
+        start = time.time()
+        loop.run_until_complete(asyncio.gather(af.read('a'), af.read('a')))
+        assert time.time() - start < 0.39
+        assert len(ticks) >= 5 and max(np.diff(ticks)) < 0.1
+        loop.run_until_complete(af.close())
+
+    def test_writes_serialized(self, tmpfile, loop, monkeypatch):
+        af = AsyncFile(tmpfile, 'w', max_workers=4)
+        active, overlaps = [0], []
+        write = af.file.write_json
+
+        def slow_write(*args, **kwargs):
+            active[0] += 1
+            overlaps.append(active[0])
+            time.sleep(0.01)
+            active[0] -= 1
+            return write(*args, **kwargs)
+
+        monkeypatch.setattr(af.file, 'write_json', slow_write)
+        loop.run_until_complete(asyncio.gather(*[af.write_json(str(i), i) for i in range(8)]))
+        assert max(overlaps) == 1
+        loop.run_until_complete(af.close())
+        with File(tmpfile) as f:
+            assert len(f) == 8
+
+    def test_executor(self, tmpfile, loop):
+        from concurrent.futures import ThreadPoolExecutor
+        executor = ThreadPoolExecutor(1)
+        with File(tmpfile, 'w') as f:
+            f.write_json('a', 1)
+        raises_regexp(ValueError, 'both executor and max_workers', AsyncFile, tmpfile,
+                      executor=executor, max_workers=2)
+        af = AsyncFile(File(tmpfile), executor=executor)
+        assert loop.run_until_complete(af.read('a')) == 1
+        loop.run_until_complete(af.close())
+        assert executor.submit(lambda: 42).result() == 42
+        executor.shutdown()
+
+    def test_refresh(self, tmpfile, loop):
+        writer = AsyncFile(tmpfile, 'w')
+        loop.run_until_complete(writer.write_json('a', 1))
+        with AsyncFile(tmpfile) as af:
+            loop.run_until_complete(writer.write_array('b', np.arange(10)))
+            assert list(af) == ['a']
+            loop.run_until_complete(af.refresh())
+            assert list(af) == ['a', 'b']
+            np.testing.assert_array_equal(loop.run_until_complete(af.read('b')), np.arange(10))
+        loop.run_until_complete(writer.close())
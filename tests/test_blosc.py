@@ -3,11 +3,15 @@
 import io
 import blosc
 import pytest
+import threading
 import numpy as np
 from pytest import raises_regexp
 
-from blox.utils import read_json
-from blox.blosc import read_blosc, write_blosc
+from blox.utils import read_json, BufferStream
+from blox.blosc import (
+    read_blosc, write_blosc, iter_blosc, blosc_options, select_compression, _auto_sample,
+    _decompress
+)
 
 
 @pytest.fixture(params=[
@@ -126,3 +130,428 @@ class TestBlosc(object):
         assert read_blosc(stream, out=out) is out
         stream.seek(0)
         np.testing.assert_array_equal(out, read_blosc(stream))
+
+
+class TestChunked(object):
+    @pytest.fixture(params=[1, 3, 7, 100])
+    def chunks(self, request):
+        return request.param
+
+    @pytest.fixture
+    def data(self):
+        return np.arange(60, dtype='i4').reshape(20, 3)
+
+    @pytest.fixture
+    def stream(self, data, chunks):
+        stream = io.BytesIO()
+        write_blosc(stream, data, chunks=chunks)
+        stream.seek(0)
+        return stream
+
+    def test_metadata(self, data, chunks, stream):
+        meta = read_json(stream)
+        assert meta['chunks'] == chunks
+        assert len(meta['offsets']) == -(-len(data) // chunks) + 1
+        assert meta['offsets'][0] == 0 and meta['offsets'][-1] == meta['length']
+        assert len(stream.getvalue()) == stream.tell() + meta['length']
+
+    def test_read(self, data, stream):
+        np.testing.assert_array_equal(read_blosc(stream), data)
+
+    @pytest.mark.parametrize('rows', [
+        slice(None), slice(0, 1), slice(5, 12), slice(-3, None), slice(18, 40), slice(7, 7),
+        slice(None, None, 2), slice(1, 19, 5), slice(None, None, -1), slice(15, 2, -4)
+    ])
+    def test_read_rows(self, data, stream, rows):
+        out = read_blosc(stream, rows=rows)
+        assert out.shape == data[rows].shape
+        np.testing.assert_array_equal(out, data[rows])
+
+    def test_read_rows_into(self, data, stream):
+        out = np.empty((4, 3), data.dtype)
+        assert read_blosc(stream, out=out, rows=slice(3, 7)) is out
+        np.testing.assert_array_equal(out, data[3:7])
+        stream.seek(0)
+        raises_regexp(ValueError, 'incompatible shape', read_blosc, stream,
+                      out=out, rows=slice(3, 8))
+
+    def test_empty(self, chunks):
+        stream = io.BytesIO()
+        write_blosc(stream, np.empty((0, 3)), chunks=chunks)
+        stream.seek(0)
+        assert read_blosc(stream).shape == (0, 3)
+        stream.seek(0)
+        assert read_blosc(stream, rows=slice(0, 5)).shape == (0, 3)
+
+    def test_invalid(self):
+        stream = io.BytesIO()
+        raises_regexp(ValueError, 'invalid chunks', write_blosc, stream, [1, 2], chunks=0)
+        raises_regexp(ValueError, 'unable to chunk a zero-dimensional array',
+                      write_blosc, stream, 42, chunks=1)
+        write_blosc(stream, 42)
+        stream.seek(0)
+        raises_regexp(ValueError, 'unable to select rows', read_blosc, stream, rows=slice(1))
+        stream = io.BytesIO()
+        write_blosc(stream, [1, 2], chunks=1)
+        stream.seek(0)
+        raises_regexp(TypeError, 'expected slice', read_blosc, stream, rows=1)
+
+    def test_unchunked_rows(self, data):
+        stream = io.BytesIO()
+        write_blosc(stream, data)
+        stream.seek(0)
+        np.testing.assert_array_equal(read_blosc(stream, rows=slice(2, 9, 3)), data[2:9:3])
+
+
+class TestFrames(object):
+    @pytest.fixture(autouse=True)
+    def limits(self, monkeypatch):
+        monkeypatch.setattr('blox.blosc.MAX_FRAME_SIZE', 100)
+        monkeypatch.setattr('blox.blosc.READ_BUFFER_SIZE', 150)
+
+    @pytest.mark.parametrize('chunks, expected', [(None, 4), (2, 2), (1000, 4)])
+    def test_split(self, chunks, expected):
+        data = np.arange(300, dtype='i8').reshape(100, 3)
+        stream = io.BytesIO()
+        write_blosc(stream, data, chunks=chunks)
+        stream.seek(0)
+        meta = read_json(stream)
+        assert meta['chunks'] == expected
+        assert len(meta['offsets']) - 1 == -(-100 // meta['chunks'])
+        for rows in [None, slice(10, 90), slice(None, None, -3)]:
+            stream.seek(0)
+            np.testing.assert_array_equal(read_blosc(stream, rows=rows),
+                                          data if rows is None else data[rows])
+
+    def test_small(self):
+        stream = io.BytesIO()
+        write_blosc(stream, np.arange(10, dtype='i1'))
+        stream.seek(0)
+        assert 'chunks' not in read_json(stream)
+
+    def test_row_too_large(self):
+        raises_regexp(ValueError, 'unable to split array into frames: row size 160 exceeds 100',
+                      write_blosc, io.BytesIO(), np.zeros((2, 20)))
+
+
+class TestUncompressed(object):
+    @pytest.mark.parametrize('chunks', [None, 3])
+    def test_roundtrip(self, chunks):
+        data = np.arange(30, dtype='f4').reshape(10, 3)
+        stream = io.BytesIO()
+        length = write_blosc(stream, data, 'none', 9, 2, chunks=chunks)
+        stream.seek(0)
+        meta = read_json(stream)
+        assert meta['comp'] == ['none', 0, 0]
+        assert meta['length'] == data.nbytes
+        assert stream.tell() + meta['length'] == length
+        for rows in [None, slice(2, 9), slice(None, None, -4)]:
+            stream.seek(0)
+            np.testing.assert_array_equal(read_blosc(stream, rows=rows),
+                                          data if rows is None else data[rows])
+
+    def test_buffer_view(self):
+        data = np.rec.fromarrays([np.arange(5), np.arange(5.)], names='x, y')
+        stream = io.BytesIO()
+        write_blosc(stream, data, 'none')
+        out = read_blosc(BufferStream(stream.getvalue()))
+        assert isinstance(out, np.recarray) and not out.flags.writeable
+        np.testing.assert_array_equal(out, data)
+        out = read_blosc(BufferStream(stream.getvalue()), rows=slice(1, 3))
+        assert not out.flags.writeable
+        np.testing.assert_array_equal(out, data[1:3])
+        out = np.empty_like(data)
+        assert read_blosc(BufferStream(stream.getvalue()), out=out) is not None
+        np.testing.assert_array_equal(out, data)
+
+
+class TestOptions(object):
+    @pytest.fixture
+    def calls(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr('blox.blosc._options', {})
+        monkeypatch.setattr(blosc, 'set_nthreads',
+                            lambda n: calls.append(('nthreads', n)) or 1)
+        monkeypatch.setattr(blosc, 'set_blocksize', lambda n: calls.append(('blocksize', n)))
+        monkeypatch.delenv('BLOX_NTHREADS', raising=False)
+        monkeypatch.delenv('BLOX_BLOCKSIZE', raising=False)
+        return calls
+
+    def test_explicit(self, calls):
+        stream = io.BytesIO()
+        write_blosc(stream, np.arange(100), nthreads=3, blocksize=1024)
+        assert calls == [('nthreads', 3), ('blocksize', 1024), ('nthreads', 1), ('blocksize', 0)]
+        stream.seek(0)
+        np.testing.assert_array_equal(read_blosc(stream, nthreads=2), np.arange(100))
+        assert calls[4:] == [('nthreads', 2), ('nthreads', 1)]
+
+    def test_default(self, calls):
+        write_blosc(io.BytesIO(), np.arange(100))
+        assert calls == []
+
+    def test_env(self, calls, monkeypatch):
+        monkeypatch.setenv('BLOX_NTHREADS', '5')
+        monkeypatch.setenv('BLOX_BLOCKSIZE', '2048')
+        write_blosc(io.BytesIO(), np.arange(100))
+        assert calls == [('nthreads', 5), ('blocksize', 2048), ('nthreads', 1), ('blocksize', 0)]
+        write_blosc(io.BytesIO(), np.arange(100), nthreads=1)
+        assert calls[4:6] == [('nthreads', 1), ('blocksize', 2048)]
+
+    def test_invalid(self, calls):
+        raises_regexp(ValueError, 'invalid nthreads', write_blosc, io.BytesIO(), [1], nthreads=0)
+        raises_regexp(ValueError, 'invalid blocksize', write_blosc, io.BytesIO(), [1],
+                      blocksize=-1)
+
+    def test_nested(self, calls):
+        with blosc_options(nthreads=4):
+            with blosc_options(nthreads=4, blocksize=16):
+                with blosc_options(blocksize=16):
+                    pass
+                assert calls == [('nthreads', 4), ('blocksize', 16)]
+            assert calls[2:] == [('blocksize', 0)]
+        assert calls[3:] == [('nthreads', 1)]
+
+    def test_concurrent(self, calls):
+        entered, release = threading.Event(), threading.Event()
+
+        def worker():
+            with blosc_options(nthreads=2):
+                entered.set()
+                release.wait()
+
+        def waiter():
+            with blosc_options(nthreads=3):
+                pass
+
+        threads = [threading.Thread(target=worker), threading.Thread(target=waiter)]
+        threads[0].start()
+        entered.wait()
+        with blosc_options(nthreads=2):
+            pass
+        assert calls == [('nthreads', 2)]
+        threads[1].start()
+        threads[1].join(0.1)
+        assert threads[1].is_alive() and calls == [('nthreads', 2)]
+        release.set()
+        for thread in threads:
+            thread.join()
+        assert calls == [('nthreads', 2), ('nthreads', 1), ('nthreads', 3), ('nthreads', 1)]
+
+    def test_restore(self):
+        previous = blosc.set_nthreads(3)
+        try:
+            with blosc_options(nthreads=2):
+                pass
+            assert blosc.set_nthreads(3) == 3
+        finally:
+            blosc.set_nthreads(previous)
+
+
+class TestIter(object):
+    @pytest.fixture
+    def data(self):
+        return np.arange(300, dtype='i8').reshape(100, 3)
+
+    @pytest.mark.parametrize('codec, chunks, make_stream', [
+        ('lz4', None, io.BytesIO), ('lz4', 8, io.BytesIO),
+        ('none', 8, io.BytesIO), ('none', None, BufferStream)
+    ])
+    @pytest.mark.parametrize('rows', [None, 1, 5, 8, 30, 200])
+    @pytest.mark.parametrize('reuse', [False, True])
+    def test_iter(self, data, codec, chunks, make_stream, rows, reuse):
+        stream = io.BytesIO()
+        write_blosc(stream, data, codec, chunks=chunks)
+        stream = make_stream(stream.getvalue())
+        expected = rows or chunks or 100
+        out = np.empty((expected, 3), data.dtype) if reuse else None
+        blocks = []
+        for block in iter_blosc(stream, rows=rows, out=out):
+            assert len(block) <= expected
+            if reuse:
+                assert np.may_share_memory(block, out)
+            blocks.append(block.copy())
+        assert len(blocks) == -(-100 // expected)
+        np.testing.assert_array_equal(np.concatenate(blocks), data)
+
+    def test_invalid(self, data):
+        stream = io.BytesIO()
+        write_blosc(stream, 42)
+        stream.seek(0)
+        raises_regexp(ValueError, 'unable to iterate over a zero-dimensional array',
+                      list, iter_blosc(stream))
+        stream = io.BytesIO()
+        write_blosc(stream, data)
+        stream.seek(0)
+        raises_regexp(ValueError, 'invalid rows', list, iter_blosc(stream, rows=-1))
+        stream.seek(0)
+        raises_regexp(ValueError, 'invalid rows', list, iter_blosc(stream, rows=0))
+        stream.seek(0)
+        raises_regexp(ValueError, 'incompatible shape', list,
+                      iter_blosc(stream, rows=10, out=np.empty((5, 3), data.dtype)))
+
+    def test_recarray(self):
+        data = np.rec.fromarrays([np.arange(10), np.arange(10.)], names='x, y')
+        stream = io.BytesIO()
+        write_blosc(stream, data, chunks=4)
+        stream.seek(0)
+        blocks = list(iter_blosc(stream))
+        assert all(isinstance(block, np.recarray) for block in blocks)
+        np.testing.assert_array_equal(np.concatenate(blocks), data)
+
+    @pytest.mark.parametrize('columnar, chunks', [(False, 100), (True, 100), (True, None)])
+    @pytest.mark.parametrize('rows', [7, 30, 100, 130])
+    def test_decompress_once(self, monkeypatch, columnar, chunks, rows):
+        data = np.rec.fromarrays([np.arange(1000), np.arange(1000.)], names='x, y')
+        stream = io.BytesIO()
+        write_blosc(stream, data, chunks=chunks, columnar=columnar)
+        calls = []
+        monkeypatch.setattr('blox.blosc._decompress',
+                            lambda *args: calls.append(1) or _decompress(*args))
+        stream.seek(0)
+        np.testing.assert_array_equal(np.concatenate(list(iter_blosc(stream, rows=rows))), data)
+        assert len(calls) == (2 if columnar else 1) * (10 if chunks else 1)
+
+
+class TestAuto(object):
+    @pytest.mark.parametrize('target', ['', ':speed', ':ratio', ':balanced'])
+    @pytest.mark.parametrize('data', [
+        np.arange(100000),
+        np.random.RandomState(0).rand(1000, 10),
+        np.zeros(1000, 'i4,f8').view(np.recarray),
+        np.array([], dtype=np.int16),
+        np.array(3.14)
+    ], ids=['int', 'float', 'recarray', 'empty', 'scalar'])
+    def test_auto(self, target, data):
+        stream = io.BytesIO()
+        write_blosc(stream, data, compression='auto' + target, level=3, chunks=None)
+        stream.seek(0)
+        comp = read_json(stream)['comp']
+        assert comp[0] in blosc.compressor_list()
+        assert comp[1] == 3 and comp[2] in (0, 1, 2)
+        stream.seek(0)
+        out = read_blosc(stream)
+        np.testing.assert_array_equal(out, data)
+        assert out.dtype == data.dtype
+
+    def test_ratio(self):
+        data = np.arange(10000, dtype=np.int64) // 7
+        cname, level, shuffle = select_compression(data, 'ratio', 5)
+        size = len(blosc.compress(data.tobytes(), 8, 5, shuffle, cname))
+        assert all(size <= len(blosc.compress(data.tobytes(), 8, 5, s, c))
+                   for c in blosc.compressor_list() for s in (0, 1, 2))
+
+    def test_sample(self, monkeypatch):
+        monkeypatch.setattr('blox.blosc.AUTO_SAMPLE_SIZE', 4096)
+        data = np.arange(1 << 20, dtype=np.int32).reshape(1024, 1024)
+        sample = _auto_sample(data)
+        assert sample.nbytes == 4096 and sample.flags.contiguous
+        np.testing.assert_array_equal(sample[:256], data.flat[:256])
+        np.testing.assert_array_equal(sample[-256:], data.flat[-256:])
+        small = np.arange(100)
+        np.testing.assert_array_equal(_auto_sample(small), small)
+
+    def test_invalid_target(self):
+        with raises_regexp(ValueError, "invalid compression target: .* got 'fast'"):
+            write_blosc(io.BytesIO(), np.arange(10), compression='auto:fast')
+
+
+class TestColumnar(object):
+    @staticmethod
+    def make_records(count=1000, record=False):
+        dtype = np.dtype([('ts', 'i8'), ('price', 'f8'), ('qty', 'u4'), ('tag', 'S4'),
+                          ('pos', 'f4', (2,)), ('inner', [('a', 'i2'), ('b', 'u1')])])
+        data = np.zeros(count, dtype)
+        data['ts'] = np.arange(count) * 1000
+        data['price'] = 100 + np.cumsum(np.random.RandomState(0).rand(count) - 0.5)
+        data['qty'] = np.arange(count) % 7
+        data['tag'] = b'abc'
+        data['pos'] = np.arange(2 * count).reshape(count, 2)
+        data['inner']['a'] = -np.arange(count)
+        return data.view(np.recarray) if record else data
+
+    @pytest.mark.parametrize('record', [False, True])
+    @pytest.mark.parametrize('chunks', [None, 64])
+    @pytest.mark.parametrize('codec', ['lz4', 'none', 'auto'])
+    def test_roundtrip(self, record, chunks, codec):
+        data = self.make_records(record=record)
+        stream = io.BytesIO()
+        write_blosc(stream, data, compression=codec, chunks=chunks, columnar=True)
+        for reader in (io.BytesIO(stream.getvalue()), BufferStream(stream.getvalue())):
+            reader.seek(0)
+            meta = read_json(reader)
+            assert meta['columnar'] and [c[0] for c in meta['columns']] == list(data.dtype.names)
+            reader.seek(0)
+            out = read_blosc(reader)
+            assert out.dtype == data.dtype and type(out) is type(data)
+            np.testing.assert_array_equal(out, data)
+            reader.seek(0)
+            np.testing.assert_array_equal(read_blosc(reader, rows=slice(900, 100, -7)),
+                                          data[900:100:-7])
+            reader.seek(0)
+            out = read_blosc(reader, fields=['price', 'ts'])
+            assert out.dtype.names == ('price', 'ts') and type(out) is type(data)
+            np.testing.assert_array_equal(out['price'], data['price'])
+            np.testing.assert_array_equal(out['ts'], data['ts'])
+            reader.seek(0)
+            out = read_blosc(reader, fields='inner', rows=slice(10, 20))
+            np.testing.assert_array_equal(out['inner'], data['inner'][10:20])
+            reader.seek(0)
+            blocks = list(iter_blosc(reader, rows=300, fields=['pos']))
+            assert [len(block) for block in blocks] == [300, 300, 300, 100]
+            np.testing.assert_array_equal(np.concatenate(blocks)['pos'], data['pos'])
+
+    def test_column_meta(self, monkeypatch):
+        data = self.make_records()
+        monkeypatch.setattr('blox.blosc.select_compression', lambda data, *args: (
+            ('zstd', 5, 1) if data.dtype.kind == 'f' else ('lz4', 5, 1)))
+        for compression, chunks in [('auto', 64), ('lz4', None)]:
+            stream = io.BytesIO()
+            write_blosc(stream, data, compression=compression, chunks=chunks, columnar=True)
+            stream.seek(0)
+            meta = read_json(stream)
+            comps = dict((name, tuple(comp)) for name, comp in meta['column_comp'])
+            if compression == 'auto':
+                assert 'comp' not in meta and meta['chunks'] == 64
+                assert comps['price'] == comps['pos'] == ('zstd', 5, 1)
+                assert comps['ts'] == ('lz4', 5, 1)
+            else:
+                assert tuple(meta['comp']) == comps['ts'] == ('lz4', 5, 1)
+                assert 'chunks' not in meta
+            stream.seek(0)
+            np.testing.assert_array_equal(read_blosc(stream), data)
+
+    def test_fields_interleaved(self):
+        data = self.make_records()
+        stream = io.BytesIO()
+        write_blosc(stream, data)
+        stream.seek(0)
+        out = read_blosc(stream, fields=['qty'])
+        assert out.dtype.names == ('qty',)
+        np.testing.assert_array_equal(out['qty'], data['qty'])
+        stream.seek(0)
+        out = np.empty(200, out.dtype)
+        assert read_blosc(stream, fields=['qty'], rows=slice(0, 200), out=out) is out
+        np.testing.assert_array_equal(out['qty'], data['qty'][:200])
+
+    def test_columnar_compresses_better(self):
+        data = self.make_records(100000)
+        interleaved, columnar = io.BytesIO(), io.BytesIO()
+        write_blosc(interleaved, data, compression='zstd')
+        write_blosc(columnar, data, compression='zstd', columnar=True)
+        assert len(columnar.getvalue()) < len(interleaved.getvalue())
+
+    def test_errors(self):
+        stream = io.BytesIO()
+        write_blosc(stream, self.make_records(), columnar=True)
+        for fields, message in ((['foo'], "unknown field: 'foo'"),
+                                ([], 'expected at least one field')):
+            stream.seek(0)
+            with raises_regexp(ValueError, message):
+                read_blosc(stream, fields=fields)
+        stream = io.BytesIO()
+        write_blosc(stream, np.arange(10), columnar=True)
+        stream.seek(0)
+        assert 'columns' not in read_json(stream)
+        stream.seek(0)
+        with raises_regexp(ValueError, 'can only select fields of structured arrays'):
+            read_blosc(stream, fields=['a'])
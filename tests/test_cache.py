@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import numpy as np
+from pytest import raises_regexp
+
+from blox.cache import ArrayCache
+
+
+class TestArrayCache(object):
+    def test_lru(self):
+        cache = ArrayCache(300)
+        arrays = [np.arange(i * 10, dtype=np.uint8) for i in range(1, 6)]
+        for i, arr in enumerate(arrays[:3]):
+            assert cache.put(i, arr) is arr and not arr.flags.writeable
+        assert len(cache) == 3 and cache.nbytes == 60 and cache.max_bytes == 300
+        assert cache.get(0) is arrays[0] and cache.get(5) is None
+        assert cache.hits == 1 and cache.misses == 1
+        cache.put(3, np.zeros(200, np.uint8))
+        assert cache.nbytes == 260 and 1 in cache
+        cache.put(4, np.zeros(50, np.uint8))
+        assert 1 not in cache and 2 in cache and 0 in cache and cache.nbytes == 290
+        cache.put(4, np.zeros(10, np.uint8))
+        assert cache.nbytes == 250 and len(cache) == 4
+        assert repr(cache) == '<blox.ArrayCache: 4 arrays, 250/300 bytes, 1 hits, 1 misses>'
+        cache.clear()
+        assert len(cache) == 0 and cache.nbytes == 0 and cache.hits == cache.misses == 0
+
+    def test_too_large(self):
+        cache = ArrayCache(10)
+        arr = np.zeros(11, np.uint8)
+        assert cache.put('a', arr) is arr and arr.flags.writeable
+        assert len(cache) == 0 and cache.nbytes == 0
+        assert cache.get('a', count_miss=False) is None and cache.misses == 0
+
+    def test_invalid(self):
+        raises_regexp(ValueError, 'invalid max_bytes', ArrayCache, -1)
+
+    def test_threads(self):
+        cache = ArrayCache(1000)
+
+        def worker(offset):
+            for i in range(200):
+                key = (offset + i) % 50
+                if cache.get(key) is None:
+                    cache.put(key, np.zeros(key, np.uint8))
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert cache.nbytes == sum(cache.get(key).nbytes for key in range(50) if key in cache)
+        assert cache.nbytes <= 1000 and cache.hits + cache.misses == 800 + len(cache)
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+import io
+import pytest
+import numpy as np
+from pytest import raises_regexp
+
+from blox.utils import read_json, BufferStream
+from blox.blosc import read_blosc, write_blosc, iter_blosc
+from blox.codecs import (
+    Codec, get_codec, get_filter, codec_list, filter_list, register_codec, _codecs
+)
+
+
+@pytest.fixture(params=codec_list())
+def codec(request):
+    return request.param
+
+
+@pytest.fixture(params=[(), ('delta',), ('xor',), ('delta', 'xor')],
+                ids=['none', 'delta', 'xor', 'delta-xor'])
+def filters(request):
+    return request.param
+
+
+@pytest.fixture(params=[
+    np.arange(1000, dtype=np.int64),
+    np.arange(1000, dtype=np.uint8),
+    (np.arange(600, dtype=np.int16) * -7).reshape((200, 3)),
+    np.linspace(0, 1, 500),
+    np.linspace(0, 1, 500).astype(np.float32),
+    np.array([], dtype=np.int32),
+    np.array(42)
+], ids=['i8', 'u1', 'i2', 'f8', 'f4', 'empty', 'scalar'])
+def array(request):
+    return request.param
+
+
+def roundtrip(data, **kwargs):
+    stream = io.BytesIO()
+    write_blosc(stream, data, **kwargs)
+    stream.seek(0)
+    return stream, read_blosc(stream)
+
+
+class TestCodecs(object):
+    def test_roundtrip(self, codec, filters, array):
+        _, out = roundtrip(array, compression=codec, filters=filters)
+        np.testing.assert_array_equal(out, array)
+        assert out.dtype == array.dtype
+
+    def test_roundtrip_chunked(self, codec, filters):
+        data = np.arange(1000, dtype=np.int64) ** 2
+        stream, out = roundtrip(data, compression=codec, filters=filters, chunks=64)
+        np.testing.assert_array_equal(out, data)
+        stream.seek(0)
+        np.testing.assert_array_equal(read_blosc(stream, rows=slice(100, 900, 3)),
+                                      data[100:900:3])
+        stream.seek(0)
+        np.testing.assert_array_equal(np.concatenate(list(iter_blosc(stream, rows=100))), data)
+
+    def test_buffer_stream(self, codec, filters):
+        data = np.arange(100, dtype=np.int32)
+        stream, _ = roundtrip(data, compression=codec, filters=filters)
+        out = read_blosc(BufferStream(stream.getvalue()))
+        np.testing.assert_array_equal(out, data)
+        if codec == 'none' and not filters:
+            assert not out.flags.writeable
+        else:
+            assert out.flags.writeable
+
+    def test_metadata(self, codec):
+        stream, _ = roundtrip(np.arange(10), compression=codec, filters='delta')
+        stream.seek(0)
+        header = read_json(stream)
+        assert header['comp'][0] == codec
+        assert header['filters'] == ['delta']
+
+    def test_unknown_codec(self):
+        with raises_regexp(ValueError, "unknown compression: 'foo'"):
+            get_codec('foo')
+        with raises_regexp(ValueError, "unknown compression: 'foo'"):
+            roundtrip(np.arange(10), compression='foo')
+
+    def test_unknown_filter(self):
+        with raises_regexp(ValueError, "unknown filter: 'foo'"):
+            get_filter('foo')
+        with raises_regexp(ValueError, "unknown filter: 'foo'"):
+            roundtrip(np.arange(10), filters=['foo'])
+
+    def test_unsupported_dtype(self, filters):
+        for data in (np.array(['foo', 'bar']), np.zeros(3, 'i4,f8'), np.zeros(3, np.float16)):
+            if not filters or data.dtype.itemsize in (1, 2, 4, 8) and \
+                    data.dtype.fields is None:
+                _, out = roundtrip(data, filters=filters)
+                np.testing.assert_array_equal(out, data)
+            else:
+                with raises_regexp(ValueError, 'filter: unsupported dtype'):
+                    roundtrip(data, filters=filters)
+
+    def test_list(self):
+        assert 'none' in codec_list()
+        assert 'lz4' in codec_list()
+        assert filter_list() == ['delta', 'xor']
+
+    def test_filters_compress_better(self):
+        data = np.arange(0, 1 << 20, 3, dtype=np.int64)
+        plain, _ = roundtrip(data, compression='zlib', shuffle=False)
+        delta, _ = roundtrip(data, compression='zlib', shuffle=False, filters='delta')
+        assert len(delta.getvalue()) < len(plain.getvalue()) // 10
+
+    def test_register_codec(self):
+        class Negate(Codec):
+            name = 'negate'
+
+            def compress(self, data, level, shuffle):
+                return (~data.view(np.ndarray).reshape(-1).view(np.uint8)).tobytes()
+
+            def decompress(self, frame, out):
+                out.reshape(-1).view(np.uint8)[:] = ~np.frombuffer(frame, np.uint8)
+
+        register_codec(Negate())
+        try:
+            data = np.arange(100)
+            stream, out = roundtrip(data, compression='negate')
+            np.testing.assert_array_equal(out, data)
+            assert 'negate' in codec_list()
+        finally:
+            del _codecs['negate']
+
+
+@pytest.mark.parametrize('name', ['zstandard', 'lz4frame'])
+def test_optional_backend(name):
+    pytest.importorskip({'zstandard': 'zstandard', 'lz4frame': 'lz4.frame'}[name])
+    assert name in codec_list()
+    data = np.random.RandomState(0).randint(0, 10, 10000)
+    stream, out = roundtrip(data, compression=name, level=3)
+    np.testing.assert_array_equal(out, data)
+    assert len(stream.getvalue()) < data.nbytes // 4
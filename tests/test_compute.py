@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+import numpy as np
+from pytest import raises_regexp
+
+from blox import File, Dataset, iter_blocks, map_blocks, reduce
+
+
+@pytest.fixture
+def arrfile(tmpfile):
+    with File(tmpfile, 'w') as f:
+        f.write_array('a', np.arange(10000, dtype='i4').reshape(2500, 4), chunks=300)
+        f.write_array('b', np.arange(100.), chunks=None)
+        f.write_array('e', np.zeros((0, 3)), chunks=None)
+        f.write_array('s', 42)
+        f.write_json('j', 1)
+    return tmpfile
+
+
+class TestCompute(object):
+    @pytest.mark.parametrize('max_workers', [1, 4])
+    def test_iter_blocks(self, arrfile, max_workers):
+        arr = np.arange(10000, dtype='i4').reshape(2500, 4)
+        with File(arrfile) as f:
+            blocks = list(iter_blocks(f, 'a', max_workers=max_workers))
+            assert [len(block) for block in blocks] == [300] * 8 + [100]
+            np.testing.assert_array_equal(np.concatenate(blocks), arr)
+            sums = list(iter_blocks(f, 'a', lambda x: x.sum(), rows=1000,
+                                    max_workers=max_workers))
+            assert sums == [arr[i:i + 1000].sum() for i in range(0, 2500, 1000)]
+            assert len(list(iter_blocks(f, 'b'))) == 1
+            blocks = list(iter_blocks(f, 'e'))
+            assert len(blocks) == 1 and blocks[0].shape == (0, 3)
+            raises_regexp(ValueError, 'can only compute over array', iter_blocks, f, 'j')
+            raises_regexp(ValueError, 'zero-dimensional', iter_blocks, f, 's')
+            raises_regexp(ValueError, 'invalid rows', iter_blocks, f, 'a', rows=0)
+            blocks = list(iter_blocks(f, 'b', rows=30, max_workers=max_workers))
+            assert [len(block) for block in blocks] == [30, 30, 30, 10]
+            np.testing.assert_array_equal(np.concatenate(blocks), np.arange(100.))
+            raises_regexp(KeyError, 'c', iter_blocks, f, 'c')
+
+    @pytest.mark.parametrize('max_workers', [1, 4])
+    def test_map_blocks(self, arrfile, max_workers):
+        arr = np.arange(10000, dtype='i4').reshape(2500, 4)
+        with File(arrfile, 'a') as f:
+            map_blocks(f, 'a', np.sqrt, 'sqrt', max_workers=max_workers)
+            map_blocks(f, 'a', lambda x: x[x[:, 0] % 3 == 0, :2], 'filtered', rows=128,
+                       compression='zstd', chunk_rows=50)
+            map_blocks(f, 'e', lambda x: x.sum(axis=1), 'empty')
+            pytest.raises(ZeroDivisionError, map_blocks, f, 'a', lambda x: 1 // 0, 'failed')
+            assert 'failed' not in f
+            f.write_json('k', 2)
+        with File(arrfile) as f:
+            np.testing.assert_array_equal(f.read('sqrt'), np.sqrt(arr))
+            assert f.info('sqrt')['chunks'] == 300
+            np.testing.assert_array_equal(f.read('filtered'), arr[arr[:, 0] % 3 == 0, :2])
+            assert f.info('filtered')['compression'][0] == 'zstd'
+            assert f.info('filtered')['chunks'] == 50
+            assert f.shape('empty') == (0,) and f.dtype('empty') == np.float64
+            assert f.read('k') == 2
+
+    def test_map_blocks_out_file(self, arrfile, tmpdir):
+        with File(arrfile) as f, File(tmpdir.join('out').strpath, 'w') as out:
+            map_blocks(f, 'b', lambda x: x * 2, 'b2', out_file=out)
+            np.testing.assert_array_equal(out.read('b2'), np.arange(100.) * 2)
+            raises_regexp(IOError, 'not writable', map_blocks, f, 'b', np.sqrt, 'c')
+
+    @pytest.mark.parametrize('max_workers', [1, 4])
+    def test_reduce(self, arrfile, max_workers):
+        arr = np.arange(10000, dtype='i4').reshape(2500, 4)
+        with File(arrfile) as f:
+            for ufunc in (np.add, np.maximum, np.minimum, np.multiply):
+                for axis in (0, 1, -1, None, (0, 1), (1, 0)):
+                    np.testing.assert_array_equal(
+                        reduce(f, 'a', ufunc, axis=axis, max_workers=max_workers, rows=700),
+                        ufunc.reduce(arr, axis=axis))
+            result = reduce(f, 'a', np.add, dtype='i8')
+            assert result.dtype == np.int64
+            np.testing.assert_array_equal(result, arr.sum(axis=0, dtype='i8'))
+            assert reduce(f, 'b', np.add, axis=None) == np.arange(100.).sum()
+            np.testing.assert_array_equal(reduce(f, 'e', np.add), np.zeros(3))
+            raises_regexp(ValueError, 'invalid axis: 2', reduce, f, 'a', np.add, axis=2)
+            raises_regexp(ValueError, 'invalid axis', reduce, f, 'a', np.add, axis='x')
+
+    def test_dataset(self, tmpdir):
+        with Dataset(tmpdir.strpath, 'a') as ds:
+            for i in range(3):
+                with ds.create_shard(str(i)) as f:
+                    f.write_array('x', np.arange(i * 100, (i + 1) * 100), chunks=30)
+            ds.refresh()
+            assert reduce(ds, 'x', np.add) == np.arange(300).sum()
+            with File(tmpdir.join('out').strpath, 'w') as out:
+                map_blocks(ds, 'x', np.negative, 'y', out_file=out, rows=64)
+                np.testing.assert_array_equal(out.read('y'), -np.arange(300))
+            raises_regexp(IOError, 'pass a writable out_file', map_blocks, ds, 'x',
+                          np.negative, 'y')
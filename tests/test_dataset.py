@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import numpy as np
+import numpy.testing as npt
+from pytest import raises_regexp
+
+from blox import Array, Dataset
+
+
+def make_shards(path):
+    with Dataset(path, 'a') as ds:
+        with ds.create_shard('a') as f:
+            f.write_array('x', np.arange(10))
+            f.write_array('only_a', np.ones((2, 3)))
+            f.write_json('meta', {'shard': 'a'})
+        with ds.create_shard('b') as f:
+            f.write_array('x', np.arange(10, 25))
+            f.write_array('y', np.zeros(4, np.float32))
+
+
+class TestDataset(object):
+    def test_keys(self, tmpdir):
+        path = tmpdir.join('ds').strpath
+        make_shards(path)
+        assert sorted(os.listdir(path)) == ['a.blx', 'b.blx']
+        with Dataset(path) as ds:
+            assert ds.mode == 'r' and ds.path == path
+            assert ds.shards == [os.path.join(path, 'a.blx'), os.path.join(path, 'b.blx')]
+            assert ds.keys() == ['meta', 'only_a', 'x', 'y'] and list(ds) == ds.keys()
+            assert ds.keys('o') == ['only_a'] and len(ds) == 4
+            assert 'x' in ds and 'y' in ds and 'z' not in ds
+            assert repr(ds) == '<blox.Dataset {!r}: 2 shards>'.format(path)
+
+    def test_read(self, tmpdir):
+        path = tmpdir.join('ds').strpath
+        make_shards(path)
+        with Dataset(path) as ds:
+            expected = np.arange(25)
+            npt.assert_array_equal(ds.read('x'), expected)
+            assert ds.shape('x') == (25,) and ds.dtype('x') == expected.dtype
+            assert ds.info('x')['shards'] == 2 and 'shards' not in ds.info('y')
+            for rows in (slice(None), slice(3, 17), slice(12, 20), slice(None, None, 3),
+                         slice(2, 24, 7), slice(None, None, -1), slice(20, 2, -4),
+                         slice(30, 40), slice(-5, None)):
+                npt.assert_array_equal(ds.read('x', rows=rows), expected[rows])
+            out = np.empty(25, expected.dtype)
+            assert ds.read('x', out=out) is out
+            npt.assert_array_equal(out, expected)
+            npt.assert_array_equal(np.concatenate(list(ds.iter_chunks('x', rows=4))), expected)
+            npt.assert_array_equal(ds.read('only_a'), np.ones((2, 3)))
+            assert ds.read('meta') == {'shard': 'a'} and ds['meta'] == {'shard': 'a'}
+            arr = ds['x']
+            assert isinstance(arr, Array) and arr.shape == (25,) and len(arr) == 25
+            npt.assert_array_equal(arr[8:12], expected[8:12])
+            assert arr[-1] == 24
+            raises_regexp(KeyError, 'z', ds.read, 'z')
+            raises_regexp(TypeError, 'expected slice', ds.read, 'x', rows=3)
+            raises_regexp(ValueError, 'can only iterate', list, ds.iter_chunks('meta'))
+
+    def test_incompatible(self, tmpdir):
+        path = tmpdir.join('ds').strpath
+        with Dataset(path, 'a') as ds:
+            with ds.create_shard('a') as f:
+                f.write_array('x', np.arange(3))
+                f.write_json('j', 1)
+            with ds.create_shard('b') as f:
+                f.write_array('x', np.arange(3, dtype=np.float32))
+                f.write_json('j', 2)
+        with Dataset(path) as ds:
+            raises_regexp(ValueError, 'incompatible parts', ds.read, 'x')
+            raises_regexp(ValueError, 'JSON values in multiple shards', ds.read, 'j')
+
+    def test_create_shard(self, tmpdir):
+        path = tmpdir.join('ds').strpath
+        with Dataset(path, 'a') as ds:
+            f = ds.create_shard()
+            f.write_array('x', np.arange(5))
+            assert f.filename.endswith('.blx.part')
+            ds.refresh()
+            assert ds.shards == [] and 'x' not in ds
+            f.close()
+            f.close()
+            ds.refresh()
+            assert len(ds.shards) == 1 and ds.shards[0].endswith('.blx')
+            npt.assert_array_equal(ds.read('x'), np.arange(5))
+            with ds.create_shard('second') as f:
+                f.write_array('x', np.arange(5, 8))
+            assert len(ds.shards) == 1
+            ds.refresh()
+            npt.assert_array_equal(np.sort(ds.read('x')), np.arange(8))
+        with Dataset(path) as ds:
+            raises_regexp(IOError, 'not writable', ds.create_shard)
+
+    def test_failed_shard(self, tmpdir):
+        path = tmpdir.join('ds').strpath
+        make_shards(path)
+        with Dataset(path, 'a') as ds:
+            with raises_regexp(ZeroDivisionError, 'division'):
+                with ds.create_shard('bad') as f:
+                    f.write_array('bad', np.arange(5))
+                    1 / 0
+            assert f._handle is None
+            f.abort()
+            shard = ds.create_shard('aborted')
+            shard.write_json('aborted', 1)
+            shard.abort()
+            ds.refresh()
+            assert sorted(os.listdir(path)) == ['a.blx', 'b.blx']
+            assert 'bad' not in ds.keys() and 'aborted' not in ds
+
+    def test_manifest(self, tmpdir):
+        path = tmpdir.join('ds').strpath
+        make_shards(path)
+        manifest = tmpdir.join('manifest.json').strpath
+        with open(manifest, 'w') as fd:
+            json.dump({'shards': ['ds/b.blx', 'ds/a.blx']}, fd)
+        with Dataset(manifest) as ds:
+            npt.assert_array_equal(ds.read('x'), np.r_[np.arange(10, 25), np.arange(10)])
+            assert ds.keys() == ['meta', 'only_a', 'x', 'y']
+        raises_regexp(ValueError, 'manifest', Dataset, manifest, 'a')
+
+    def test_invalid(self, tmpdir):
+        raises_regexp(ValueError, 'invalid mode', Dataset, tmpdir.strpath, 'w')
+        raises_regexp(IOError, 'no such dataset', Dataset, tmpdir.join('missing').strpath)
+        with Dataset(tmpdir.strpath) as ds:
+            assert ds.keys() == [] and len(ds) == 0
+            raises_regexp(ValueError, 'invalid key', ds.read, 1)
+
+    def test_file_options(self, tmpdir):
+        path = tmpdir.join('ds').strpath
+        make_shards(path)
+        with Dataset(path, cache=1 << 20) as ds:
+            assert ds.read('x') is not ds.read('x')
+            assert ds.read('y') is ds.read('y')
+        with Dataset(path, 'a', mmap=True, cache=1 << 20, nthreads=2) as ds:
+            with ds.create_shard('c') as f:
+                assert f.nthreads == 2 and f.cache is None
+                f.write_array('x', np.arange(25, 30))
+            ds.refresh()
+            npt.assert_array_equal(ds.read('x'), np.arange(30))
@@ -2,14 +2,21 @@
 
 import io
 import os
+import json
+import time
 import blosc
 import pytest
 import py.path
+import threading
 import numpy as np
 from pytest import raises_regexp
 
-from blox.file import File, is_blox, FORMAT_STRING, FORMAT_VERSION
-from blox.utils import write_i64
+from blox.file import File, Array, Group, is_blox, repack, merge, FORMAT_STRING, FORMAT_VERSION
+from blox.index import BinaryIndex, SortedIndex
+from blox.cache import ArrayCache
+from blox.stats import Stats
+from blox.utils import write_i64, write_json
+from blox.blosc import pack_blosc, read_blosc, write_packed
 
 
 def test_is_blox(tmpfile):
@@ -224,3 +231,795 @@ class TestFile(object):
             assert len(f) == 2
         with File(tmpfile) as f:
             assert len(f) == 2
+
+    def test_chunked(self, tmpfile):
+        arr = np.arange(1000).reshape(250, 4)
+        with File(tmpfile, 'w') as f:
+            f.write_array('a', arr, chunks=16)
+            f.write_json('b', 42)
+            assert f.info('a')['chunks'] == 16
+        with File(tmpfile) as f:
+            np.testing.assert_array_equal(f.read('a'), arr)
+            np.testing.assert_array_equal(f.read('a', rows=slice(100, 120)), arr[100:120])
+            pytest.raises_regexp(ValueError, 'can only select rows of array values',
+                                 f.read, 'b', rows=slice(1))
+
+    def test_getitem(self, tmpfile):
+        arr = np.arange(1000).reshape(250, 4)
+        with File(tmpfile, 'w') as f:
+            f.write_array('a', arr, chunks=16)
+            f.write_array('b', 42)
+            f.write_json('c', {'foo': 'bar'})
+        with File(tmpfile) as f:
+            a = f['a']
+            assert isinstance(a, Array)
+            assert a.key == 'a' and a.shape == arr.shape and a.dtype == arr.dtype
+            assert a.ndim == 2 and len(a) == 250
+            np.testing.assert_array_equal(np.asarray(a), arr)
+            for index in [5, -1, slice(10, 50), (slice(10, 50), 2), (7, slice(1, 3)),
+                          (Ellipsis, 1), [1, 5, 9], slice(None, None, -7)]:
+                np.testing.assert_array_equal(a[index], arr[index])
+            pytest.raises_regexp(IndexError, 'out of bounds', a.__getitem__, 250)
+            assert f['b'][()] == 42
+            pytest.raises_regexp(TypeError, 'unsized object', len, f['b'])
+            assert f['c'] == {'foo': 'bar'}
+            pytest.raises_regexp(KeyError, 'd', f.__getitem__, 'd')
+
+    def test_recover_unclosed(self, tmpfile):
+        f = File(tmpfile, 'w')
+        f.write_json('a', 42)
+        f.write_array('b', [1, 2, 3])
+        pytest.raises_regexp(ValueError, 'unable to serialize: invalid dtype',
+                             f.write_array, 'c', {})
+        f.write_json('d', 'foo')
+        f._handle.flush()
+        with File(tmpfile) as f2:
+            assert list(f2) == ['a', 'b', 'd']
+            assert f2.read('a') == 42 and f2.read('d') == 'foo'
+            np.testing.assert_array_equal(f2.read('b'), [1, 2, 3])
+        f.close()
+        with File(tmpfile) as f2:
+            assert list(f2) == ['a', 'b', 'd']
+
+    def test_index_written_on_close(self, tmpfile, monkeypatch):
+        calls = []
+        write_index = File._write_index
+        monkeypatch.setattr(File, '_write_index', lambda self: calls.append(1) or write_index(self))
+        with File(tmpfile, 'w') as f:
+            for i in range(100):
+                f.write_json(str(i), i)
+            assert len(calls) == 1
+        assert len(calls) == 2
+        with File(tmpfile) as f:
+            assert len(f) == 100 and f.read('42') == 42
+
+    @pytest.mark.parametrize('max_workers', [1, 4])
+    def test_write_many(self, tmpfile, max_workers):
+        arrays = {str(i): np.arange(i * 10).reshape(i, 10) for i in range(20)}
+        with File(tmpfile, 'w') as f:
+            f.write_json('x', 42)
+            f.write_many(arrays, compression='zstd', level=3, chunks=4, max_workers=max_workers)
+            pytest.raises_regexp(ValueError, "key already exists: 'x'",
+                                 f.write_many, {'y': [1], 'x': [2]})
+            pytest.raises_regexp(ValueError, 'duplicate keys',
+                                 f.write_many, [('y', [1]), ('y', [2])])
+            assert len(f) == 21
+            assert f.info('5')['compression'] == ('zstd', 3, 1)
+        with File(tmpfile) as f:
+            assert len(f) == 21
+            for key, arr in arrays.items():
+                np.testing.assert_array_equal(f.read(key), arr)
+
+    def test_batch(self, tmpfile, monkeypatch):
+        f = File(tmpfile, 'w')
+        calls = []
+        write_journal = File._write_journal
+        monkeypatch.setattr(File, '_write_journal',
+                            lambda self, *entries: calls.append(entries) or
+                            write_journal(self, *entries))
+        with f.batch():
+            f.write_json('a', 1)
+            with f.batch():
+                f.write_array('b', [1, 2])
+            pytest.raises_regexp(ValueError, 'unable to serialize: invalid dtype',
+                                 f.write_array, 'c', {})
+            f.write_json('d', 2)
+            assert not calls
+        assert [[entry[0] for entry in entries] for entries in calls] == [['a', 'b', 'd']]
+        with File(tmpfile) as f2:
+            assert list(f2) == ['a', 'b', 'd']
+        f.close()
+
+    def test_mmap(self, tmpfile):
+        arr = np.arange(1000).reshape(250, 4)
+        with File(tmpfile, 'w') as f:
+            f.write_array('a', arr, chunks=16)
+            f.write_array('b', arr, compression='none')
+            f.write_array('c', arr, compression='none', chunks=16)
+            f.write_json('d', [1, 2])
+        pytest.raises_regexp(ValueError, 'memory mapping is only supported in read mode',
+                             File, tmpfile, 'w', mmap=True)
+        f = File(tmpfile, mmap=True)
+        np.testing.assert_array_equal(f.read('a'), arr)
+        np.testing.assert_array_equal(f['a'][10:20], arr[10:20])
+        assert f.read('d') == [1, 2]
+        views = [f.read('b'), f.read('c'), f['b'][5:10]]
+        for view in views:
+            assert not view.flags.writeable and not view.flags.owndata
+        np.testing.assert_array_equal(views[0], arr)
+        np.testing.assert_array_equal(views[1], arr)
+        np.testing.assert_array_equal(views[2], arr[5:10])
+        out = np.empty_like(arr)
+        f.read('b', out=out)
+        np.testing.assert_array_equal(out, arr)
+        f.close()
+        np.testing.assert_array_equal(views[0], arr)
+        del views
+
+    @pytest.mark.parametrize('max_workers', [1, 8])
+    @pytest.mark.parametrize('mmap', [False, True])
+    def test_read_many(self, tmpfile, max_workers, mmap):
+        arrays = {str(i): np.arange(i * 100).reshape(i, 100) for i in range(50)}
+        with File(tmpfile, 'w') as f:
+            f.write_many(arrays, chunks=3)
+            f.write_json('json', {'a': 1})
+            result = f.read_many(['1', 'json'])
+            np.testing.assert_array_equal(result['1'], arrays['1'])
+        with File(tmpfile, mmap=mmap) as f:
+            pytest.raises_regexp(KeyError, 'foo', f.read_many, ['1', 'foo'])
+            out = np.empty_like(arrays['7'])
+            result = f.read_many(list(arrays) + ['json'], out={'7': out},
+                                 max_workers=max_workers)
+            assert sorted(result) == sorted(arrays) + ['json']
+            assert result['7'] is out and result['json'] == {'a': 1}
+            for key, arr in arrays.items():
+                np.testing.assert_array_equal(result[key], arr)
+        pytest.raises_regexp(IOError, 'the file handle has been closed', f.read_many, ['1'])
+
+    @pytest.mark.parametrize('mmap', [False, True])
+    def test_concurrent_readers(self, tmpfile, mmap):
+        arrays = {str(i): np.arange(i * 50).reshape(i, 50) for i in range(1, 30)}
+        with File(tmpfile, 'w') as f:
+            f.write_many(arrays, chunks=2)
+        errors = []
+        with File(tmpfile, mmap=mmap) as f:
+            def worker(seed):
+                try:
+                    for key in np.random.RandomState(seed).permutation(sorted(arrays)):
+                        assert f.shape(key) == arrays[key].shape
+                        assert f.dtype(key) == arrays[key].dtype
+                        assert f.info(key)['chunks'] == 2
+                        np.testing.assert_array_equal(f.read(key), arrays[key])
+                        np.testing.assert_array_equal(f[key][1:], arrays[key][1:])
+                except Exception as e:
+                    errors.append(e)
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        assert not errors
+
+    def test_blosc_options(self, tmpfile, monkeypatch):
+        calls = []
+        monkeypatch.setattr('blox.file.pack_blosc',
+                            lambda *args, **kwargs: calls.append(args[-2:]) or
+                            pack_blosc(*args, **kwargs))
+        monkeypatch.setattr('blox.file.read_blosc',
+                            lambda *args, **kwargs: calls.append(kwargs['nthreads']) or
+                            read_blosc(*args, **kwargs))
+        with File(tmpfile, 'w', nthreads=4, blocksize=4096) as f:
+            assert f.nthreads == 4 and f.blocksize == 4096
+            f.write_many({'a': [1, 2]})
+            f.write_many({'b': [1, 2]}, nthreads=1, blocksize=0)
+            f.read('a')
+            f.read('a', nthreads=2)
+        assert calls == [(4, 4096), (1, 0), 4, 2]
+        with File(tmpfile) as f:
+            assert f.nthreads is None and f.blocksize is None
+
+    def test_info_from_index(self, tmpfile, monkeypatch):
+        with File(tmpfile, 'w') as f:
+            f.write_array('a', np.arange(12).reshape(3, 4), chunks=2)
+            f.write_many({'b': np.zeros(5, 'f4')})
+            f.write_json('c', 42)
+            f._handle.flush()
+            with File(tmpfile) as f2:
+                assert f2._index['a'][2]['shape'] == [3, 4]
+                assert 'offsets' not in f2._index['a'][2]
+        calls = []
+        reader = File._reader
+        monkeypatch.setattr(File, '_reader', lambda self, offset: calls.append(offset) or
+                            reader(self, offset))
+        with File(tmpfile) as f:
+            assert f.info('a') == {'type': 'array', 'shape': (3, 4), 'dtype': np.dtype(int),
+                                   'compression': ('lz4', 5, 1), 'chunks': 2}
+            assert f.shape('b') == (5,) and f.dtype('b') == np.dtype('f4')
+            assert f.info('c') == {'type': 'json'}
+            f.info('a')['shape'] = None
+            assert f.shape('a') == (3, 4)
+            assert not calls
+
+    def test_info_cache(self, tmpfile, monkeypatch):
+        with File(tmpfile, 'w') as f:
+            f.write_array('a', np.arange(12).reshape(3, 4))
+            f._index['a'] = f._index['a'][:2]
+        calls = []
+        reader = File._reader
+        monkeypatch.setattr(File, '_reader', lambda self, offset: calls.append(offset) or
+                            reader(self, offset))
+        with File(tmpfile) as f:
+            for _ in range(3):
+                assert f.shape('a') == (3, 4)
+                assert f.dtype('a') == np.dtype(int)
+            assert len(calls) == 1
+
+    @pytest.mark.parametrize('compression', ['lz4', 'none'])
+    def test_array_writer(self, tmpfile, compression):
+        arr = np.arange(3000, dtype='i4').reshape(1000, 3)
+        with File(tmpfile, 'w') as f:
+            f.write_json('a', 1)
+            with f.array_writer('b', 'i4', chunk_rows=64, compression=compression) as w:
+                assert w.key == 'b' and w.dtype == np.dtype('i4') and w.shape is None
+                for start in range(0, 1000, 150):
+                    w.append(arr[start:start + 150])
+                assert w.shape == (1000, 3)
+                pytest.raises_regexp(IOError, "an array writer is active: 'b'",
+                                     f.write_json, 'c', 2)
+                pytest.raises_regexp(ValueError, 'incompatible shape', w.append, np.zeros((1, 2)))
+            pytest.raises_regexp(IOError, 'the array writer has been closed', w.append, arr)
+            f.write_json('c', 2)
+            assert f.info('b')['chunks'] == 64
+            np.testing.assert_array_equal(f.read('b'), arr)
+        for mmap in (False, True):
+            with File(tmpfile, mmap=mmap) as f:
+                assert list(f) == ['a', 'b', 'c'] and f.read('c') == 2
+                np.testing.assert_array_equal(f.read('b'), arr)
+                np.testing.assert_array_equal(f['b'][100:900:7], arr[100:900:7])
+
+    def test_array_writer_default_chunks(self, tmpfile, monkeypatch):
+        monkeypatch.setattr('blox.blosc.DEFAULT_CHUNK_SIZE', 100)
+        with File(tmpfile, 'w') as f:
+            with f.array_writer('a', 'f8', shape=(2,)) as w:
+                w.append(np.ones((30, 2)))
+                w.append(np.zeros((0, 2)))
+            with f.array_writer('b', [('x', 'i4'), ('y', 'f8')]):
+                pass
+            assert f.info('a')['chunks'] == 6
+            np.testing.assert_array_equal(f.read('a'), np.ones((30, 2)))
+            assert f.shape('b') == (0,)
+
+    def test_array_writer_abort(self, tmpfile):
+        with File(tmpfile, 'w') as f:
+            f.write_json('a', 1)
+            with pytest.raises(RuntimeError):
+                with f.array_writer('b', 'i8', chunk_rows=10) as w:
+                    w.append(np.arange(100))
+                    raise RuntimeError
+            f.write_json('c', 2)
+            w = f.array_writer('d', 'i8', chunk_rows=10)
+            w.append(np.arange(100))
+            f._handle.flush()
+            with File(tmpfile) as f2:
+                assert list(f2) == ['a', 'c']
+        with File(tmpfile) as f:
+            assert list(f) == ['a', 'c'] and f.read('c') == 2
+
+    @pytest.mark.parametrize('mmap', [False, True])
+    def test_iter_chunks(self, tmpfile, mmap):
+        arr = np.arange(10000, dtype='f8').reshape(2500, 4)
+        with File(tmpfile, 'w') as f:
+            f.write_array('a', arr, chunks=128)
+            f.write_json('b', 1)
+        with File(tmpfile, mmap=mmap) as f:
+            pytest.raises_regexp(ValueError, 'can only iterate over array values',
+                                 f.iter_chunks, 'b')
+            pytest.raises_regexp(KeyError, 'c', f.iter_chunks, 'c')
+            total, count = np.zeros(4), 0
+            out = np.empty((300, 4))
+            for block in f.iter_chunks('a', rows=300, out=out):
+                total += block.sum(axis=0)
+                count += len(block)
+            assert count == 2500
+            np.testing.assert_array_equal(total, arr.sum(axis=0))
+            assert [len(block) for block in f.iter_chunks('a')] == [128] * 19 + [68]
+
+    def test_append_mode(self, tmpfile):
+        with File(tmpfile, 'w') as f:
+            f.write_json('a', 1)
+        with File(tmpfile, 'a') as f:
+            assert f.mode == 'a' and f.writable
+            assert list(f) == ['a'] and f.read('a') == 1
+            f.write_array('b', [1, 2])
+            f._handle.flush()
+            with File(tmpfile) as f2:
+                assert list(f2) == ['a', 'b']
+        with File(tmpfile) as f:
+            assert list(f) == ['a', 'b']
+            np.testing.assert_array_equal(f.read('b'), [1, 2])
+        with File(tmpfile + '.2', 'a') as f:
+            f.write_json('c', 3)
+        with File(tmpfile + '.2') as f:
+            assert list(f) == ['c']
+
+    @pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason='requires /proc')
+    def test_close_releases_descriptors(self, tmpfile):
+        with File(tmpfile, 'w') as f:
+            f.write_array('a', np.arange(10))
+        count = len(os.listdir('/proc/self/fd'))
+        for mmap in (False, True) * 50:
+            with File(tmpfile, mmap=mmap) as f:
+                np.testing.assert_array_equal(f.read('a'), np.arange(10))
+        assert len(os.listdir('/proc/self/fd')) <= count
+        writer = File(tmpfile, 'a')
+        with File(tmpfile) as f:
+            for i in range(50):
+                writer.write_json(str(i), i)
+                writer.close()
+                f.refresh()
+                assert isinstance(f._index, BinaryIndex) and f.read(str(i)) == i
+                writer = File(tmpfile, 'a')
+            assert len(os.listdir('/proc/self/fd')) <= count + 3
+        writer.close()
+
+    def test_append_unmodified(self, tmpfile):
+        with File(tmpfile, 'w') as f:
+            for i in range(100):
+                f.write_json(str(i), i)
+        size = os.path.getsize(tmpfile)
+        for _ in range(5):
+            with File(tmpfile, 'a') as f:
+                assert f.read('42') == 42
+                with f.batch():
+                    pass
+        assert os.path.getsize(tmpfile) == size
+        with File(tmpfile, 'a') as f:
+            f.write_json('x', 1)
+        with File(tmpfile) as f:
+            assert isinstance(f._index, BinaryIndex) and len(f) == 101
+
+    def test_delete_overwrite(self, tmpfile):
+        with File(tmpfile, 'w') as f:
+            f.write_json('a', 1)
+            f.write_array('b', np.arange(10))
+            f.write_json('c', 3)
+            f.delete('a')
+            pytest.raises_regexp(KeyError, 'a', f.delete, 'a')
+            pytest.raises_regexp(ValueError, "key already exists: 'b'",
+                                 f.write_array, 'b', [1])
+            f.write_array('b', np.arange(3, dtype='f4'), overwrite=True)
+            assert f.shape('b') == (3,)
+            with f.batch():
+                f.delete('c')
+                f.write_many({'c': [4], 'd': [5]}, overwrite=True)
+            f.write_json('a', 'x', overwrite=True)
+            f._handle.flush()
+            with File(tmpfile) as f2:
+                assert list(f2) == ['a', 'b', 'c', 'd'] and f2.read('a') == 'x'
+                assert f2.dtype('b') == np.dtype('f4')
+                np.testing.assert_array_equal(f2.read('c'), [4])
+            with f.array_writer('d', 'i8', overwrite=True) as w:
+                w.append([1, 2, 3])
+        with File(tmpfile) as f:
+            np.testing.assert_array_equal(f.read('d'), [1, 2, 3])
+        with File(tmpfile, 'a') as f:
+            f.delete('d')
+        with File(tmpfile) as f:
+            assert list(f) == ['a', 'b', 'c']
+        pytest.raises_regexp(IOError, 'file is not writable', File(tmpfile).delete, 'a')
+
+    def test_repack(self, tmpfile):
+        arr = np.arange(10000).reshape(1000, 10)
+        with File(tmpfile, 'w') as f:
+            f.write_array('a', arr, chunks=100)
+            f.write_array('b', arr, compression='none')
+            f.write_json('c', {'x': 1})
+            with f.array_writer('d', arr.dtype, chunk_rows=64) as w:
+                w.append(arr)
+            for i in range(5):
+                f.write_array('e', arr * i, overwrite=True)
+            f.delete('b')
+        size = os.path.getsize(tmpfile)
+        pytest.raises_regexp(ValueError, 'into itself', repack, tmpfile, tmpfile)
+        reclaimed = repack(tmpfile, tmpfile + '.2')
+        assert reclaimed == size - os.path.getsize(tmpfile + '.2') > 0
+        with File(tmpfile + '.2') as f:
+            assert list(f) == ['a', 'c', 'd', 'e']
+            assert f.info('a')['chunks'] == 100
+            np.testing.assert_array_equal(f.read('a'), arr)
+            np.testing.assert_array_equal(f['a'][150:250], arr[150:250])
+            np.testing.assert_array_equal(f.read('d'), arr)
+            np.testing.assert_array_equal(f.read('e'), arr * 4)
+            assert f.read('c') == {'x': 1}
+
+    def test_repack_in_place(self, tmpfile):
+        with File(tmpfile, 'w') as f:
+            f.write_array('a', np.arange(1000))
+            f.write_array('a', np.arange(5), overwrite=True)
+            f.write_json('b', 1)
+            size = os.path.getsize(tmpfile)
+            with f.batch():
+                pytest.raises_regexp(IOError, 'unable to repack inside a batch', f.repack)
+            reclaimed = f.repack()
+            assert reclaimed == size - f.filesize > 0
+            assert f.repack() == 0
+            np.testing.assert_array_equal(f.read('a'), np.arange(5))
+            f.write_json('c', 2)
+        assert not os.path.exists(tmpfile + '.repack')
+        with File(tmpfile) as f:
+            assert list(f) == ['a', 'b', 'c'] and f.read('c') == 2
+            np.testing.assert_array_equal(f.read('a'), np.arange(5))
+
+    @pytest.mark.parametrize('mmap', [False, True])
+    def test_refresh(self, tmpfile, mmap):
+        writer = File(tmpfile, 'w')
+        writer.write_array('a', np.arange(10))
+        with File(tmpfile, mmap=mmap) as f:
+            assert list(f) == ['a']
+            writer.write_json('b', 1)
+            with writer.batch():
+                writer.write_array('c', np.arange(100000))
+                writer.write_json('d', 2)
+                f.refresh()
+                assert list(f) == ['a', 'b']
+            writer.write_array('a', np.ones(3), overwrite=True)
+            writer.delete('b')
+            assert list(f) == ['a', 'b']
+            f.refresh()
+            assert list(f) == ['a', 'c', 'd'] and f.shape('a') == (3,)
+            np.testing.assert_array_equal(f.read('c'), np.arange(100000))
+            writer.refresh()
+            writer.close()
+            f.refresh()
+            assert isinstance(f._index, BinaryIndex) and list(f) == ['a', 'c', 'd']
+            np.testing.assert_array_equal(f.read('a'), np.ones(3))
+            f.close()
+            pytest.raises_regexp(IOError, 'closed', f.refresh)
+
+    def test_refresh_rewritten(self, tmpfile):
+        with File(tmpfile, 'w') as f:
+            f.write_array('a', np.zeros(100))
+        with File(tmpfile, cache=1 << 20) as f:
+            np.testing.assert_array_equal(f.read('a'), np.zeros(100))
+            time.sleep(0.01)
+            with File(tmpfile, 'w') as writer:
+                writer.write_array('a', np.ones(100))
+            f.refresh()
+            np.testing.assert_array_equal(f.read('a'), np.ones(100))
+        with File(tmpfile, cache=1 << 20) as f:
+            stamp = f._stamp
+            with File(tmpfile, 'a') as writer:
+                writer.write_json('b', 1)
+            f.read('a')
+            assert f._identity == stamp and stamp[-1] < os.path.getsize(tmpfile)
+
+    def test_refresh_repacked(self, tmpfile):
+        with File(tmpfile, 'w') as writer:
+            writer.write_array('a', np.arange(1000))
+            writer.write_array('a', np.arange(5), overwrite=True)
+            with File(tmpfile) as f:
+                writer.repack()
+                writer.write_json('b', 1)
+                np.testing.assert_array_equal(f.read('a'), np.arange(5))
+                f.refresh()
+                assert list(f) == ['a', 'b'] and f.read('b') == 1
+                np.testing.assert_array_equal(f.read('a'), np.arange(5))
+
+    def test_refresh_concurrent(self, tmpfile):
+        writer = File(tmpfile, 'w')
+        reader, errors, done = File(tmpfile), [], threading.Event()
+
+        def tail():
+            try:
+                while not done.is_set():
+                    reader.refresh()
+                    for key in reader:
+                        np.testing.assert_array_equal(reader.read(key), np.arange(int(key)))
+            except Exception as e:
+                errors.append(e)
+        thread = threading.Thread(target=tail)
+        thread.start()
+        try:
+            for i in range(200):
+                writer.write_array(str(i), np.arange(i), chunks=7)
+        finally:
+            done.set()
+            thread.join()
+        writer.close()
+        reader.refresh()
+        assert not errors and len(reader) == 200
+        reader.close()
+
+    @pytest.mark.parametrize('method', ['native', 'sendfile', 'buffered'])
+    @pytest.mark.parametrize('mmap', [False, True])
+    def test_copy_from(self, tmpfile, monkeypatch, method, mmap):
+        if method != 'native':
+            monkeypatch.delattr(os, 'copy_file_range', raising=False)
+        if method == 'buffered':
+            monkeypatch.delattr(os, 'sendfile', raising=False)
+        monkeypatch.setattr('blox.file.COPY_BUFFER_SIZE', 1000)
+        arr = np.arange(10000).reshape(1000, 10)
+        with File(tmpfile, 'w') as f:
+            f.write_array('a', arr, chunks=100)
+            f.write_json('b', [1, 2])
+            with f.array_writer('c', arr.dtype, chunk_rows=64) as w:
+                w.append(arr)
+        with File(tmpfile + '.2', 'w') as f:
+            f.write_json('x', 0)
+            with File(tmpfile, mmap=mmap) as source:
+                pytest.raises_regexp(KeyError, 'd', f.copy_from, source, ['a', 'd'])
+                f.copy_from(source, ['c', 'b'])
+                pytest.raises_regexp(ValueError, "key already exists: 'b'",
+                                     f.copy_from, source, ['b'])
+            f.copy_from(tmpfile, ['a', 'b'], overwrite=True)
+            pytest.raises_regexp(ValueError, 'into itself', f.copy_from, f)
+            pytest.raises_regexp(ValueError, 'duplicate keys', f.copy_from, tmpfile, ['a', 'a'],
+                                 overwrite=True)
+            assert f.info('a')['chunks'] == 100
+        with File(tmpfile + '.2') as f:
+            assert list(f) == ['a', 'b', 'c', 'x']
+            np.testing.assert_array_equal(f.read('a'), arr)
+            np.testing.assert_array_equal(f['c'][500:], arr[500:])
+            assert f.read('b') == [1, 2]
+
+    def test_merge(self, tmpdir):
+        filenames = [tmpdir.join('{}.blx'.format(i)).strpath for i in range(3)]
+        for i, filename in enumerate(filenames):
+            with File(filename, 'w') as f:
+                f.write_array('a{}'.format(i), np.arange(i + 1))
+                f.write_json('shared', i)
+        output = tmpdir.join('merged.blx').strpath
+        pytest.raises_regexp(ValueError, "key already exists: 'shared'",
+                             merge, filenames, output)
+        pytest.raises_regexp(ValueError, 'into itself', merge, filenames, filenames[1])
+        merge(filenames, output, overwrite=True)
+        with File(output) as f:
+            assert list(f) == ['a0', 'a1', 'a2', 'shared']
+            assert f.read('shared') == 2
+            np.testing.assert_array_equal(f.read('a2'), [0, 1, 2])
+
+    def test_filters(self, tmpfile):
+        arr = np.arange(0, 30000, 3, dtype=np.int64).reshape(1000, 10)
+        with File(tmpfile, 'w') as f:
+            f.write_array('a', arr, compression='zlib', filters=['delta'])
+            f.write_many({'b': arr, 'c': arr[::-1].copy()}, compression='none', filters='xor')
+            with f.array_writer('d', arr.dtype, chunk_rows=64, filters=['delta', 'xor']) as w:
+                w.append(arr)
+            pytest.raises_regexp(ValueError, 'delta filter: unsupported dtype',
+                                 f.write_array, 'e', np.zeros(3, 'i4,f8'), filters='delta')
+            pytest.raises_regexp(ValueError, "unknown filter: 'foo'",
+                                 f.array_writer, 'e', 'i4', filters='foo')
+            assert 'e' not in f
+        for mmap in (False, True):
+            with File(tmpfile, mmap=mmap) as f:
+                assert f.info('a')['filters'] == ('delta',)
+                assert f.info('d')['filters'] == ('delta', 'xor')
+                for key, expected in (('a', arr), ('b', arr), ('c', arr[::-1]), ('d', arr)):
+                    np.testing.assert_array_equal(f.read(key), expected)
+                    np.testing.assert_array_equal(f[key][100:900:7], expected[100:900:7])
+                assert f.read('b').flags.writeable
+
+    def test_auto_compression(self, tmpfile):
+        arr = np.arange(50000, dtype=np.int64).reshape(5000, 10)
+        with File(tmpfile, 'w') as f:
+            f.write_array('a', arr, compression='auto:ratio')
+            f.write_many({'b': arr, 'c': arr[:10]}, compression='auto', level=1)
+            with f.array_writer('d', arr.dtype, chunk_rows=1000, compression='auto:speed') as w:
+                w.append(arr)
+            with f.array_writer('e', arr.dtype, compression='auto') as w:
+                pass
+            pytest.raises_regexp(ValueError, 'invalid compression target',
+                                 f.array_writer, 'f', 'i4', compression='auto:foo')
+        with File(tmpfile) as f:
+            for key in 'abcde':
+                cname, level, shuffle = f.info(key)['compression']
+                assert cname in blosc.compressor_list() and shuffle in (0, 1, 2)
+            assert f.info('b')['compression'][1] == 1
+            for key in 'abd':
+                np.testing.assert_array_equal(f.read(key), arr)
+            assert f.shape('e') == (0,)
+
+    def test_stats(self, tmpfile):
+        arr = np.arange(10000, dtype=np.int64)
+        with File(tmpfile, 'w') as f:
+            assert f.stats is None
+        events = []
+        with File(tmpfile, 'w', trace=lambda *args: events.append(args)) as f:
+            stats = f.stats
+            assert isinstance(stats, Stats) and stats.phase('write_index')['calls'] == 1
+            f.write_json('a', [1, 2, 3])
+            f.write_array('b', arr, chunks=1000)
+            f.write_many({'c': arr, 'd': arr[:10]}, compression='zlib')
+            with f.array_writer('e', arr.dtype, chunk_rows=4000) as w:
+                w.append(arr)
+            assert stats.phase('write_json')['calls'] == 1
+            assert stats.phase('write_json')['bytes'] == len(b'[1,2,3]') + 8
+            write = stats.phase('write_blosc')
+            assert write['calls'] == 3 + 4 and write['raw_bytes'] == 3 * arr.nbytes + 80
+            assert 0 < write['bytes'] < write['raw_bytes'] and write['time'] > 0
+            assert stats.bytes_written >= os.path.getsize(tmpfile) - 16
+            assert all(e[1] is None for e in events if e[0] == 'write_index')
+            assert [e[1] for e in events if e[0] == 'write_blosc'] == list('bcd') + ['e'] * 4
+            stats.reset()
+            assert stats.calls == 0 and stats.bytes_written == 0
+        shared = Stats()
+        for mmap in (False, True):
+            with File(tmpfile, mmap=mmap, stats=shared) as f:
+                assert f.stats is shared
+                index = shared.phase('read_index')
+                assert index['calls'] == 1 + mmap and index['bytes'] > 0
+                assert f.read('a') == [1, 2, 3]
+                np.testing.assert_array_equal(f.read('b'), arr)
+                np.testing.assert_array_equal(f.read('b', rows=slice(0, 500)), arr[:500])
+                assert sum(len(c) for c in f.iter_chunks('e', rows=3000)) == len(arr)
+        read = shared.phase('read_blosc')
+        assert read['calls'] == 2 * (2 + 4) and read['raw_bytes'] == 2 * (2 * 80000 + 4000)
+        assert 0 < read['bytes'] < read['raw_bytes']
+        assert shared.phase('read_json') == dict(shared.phase('read_json'), calls=2,
+                                                 bytes=2 * (len(b'[1,2,3]') + 8))
+        assert shared.bytes_read == sum(shared.phase(p)['bytes']
+                                        for p in ('read_blosc', 'read_json', 'read_index'))
+        assert set(shared.as_dict()) >= {'read_blosc', 'bytes_read', 'raw_bytes_written'}
+        pytest.raises_regexp(ValueError, 'unknown phase', shared.phase, 'foo')
+        pytest.raises_regexp(ValueError, 'unable to set a trace callback', File, tmpfile,
+                             stats=shared, trace=events.append)
+        with File(tmpfile + '.copy', 'w', stats=True) as f:
+            f.copy_from(tmpfile)
+            copy = f.stats.phase('copy')
+            assert copy['calls'] == 5 and copy['bytes'] == copy['raw_bytes'] > 0
+
+    def test_binary_index(self, tmpfile, monkeypatch):
+        keys = ['key{:05}'.format(i) for i in range(1000)]
+        with File(tmpfile, 'w') as f:
+            with f.batch():
+                for i, key in enumerate(keys):
+                    f.write_json(key, i)
+            f.write_array(u'ключ', np.arange(3))
+        calls = []
+        loads = json.loads
+        monkeypatch.setattr('blox.index.json', type('json', (), {'loads': staticmethod(
+            lambda *args: calls.append(args) or loads(*args))}))
+        for mmap in (False, True):
+            with File(tmpfile, mmap=mmap) as f:
+                assert isinstance(f._index, BinaryIndex)
+                assert f.read('key00500') == 500 and f.read('key00999') == 999
+                assert 'key01000' not in f and len(f) == 1001
+                assert not calls
+                assert f.shape(u'ключ') == (3,) and len(calls) == 1
+                assert list(f) == keys + [u'ключ']
+            assert 'key00042' not in f and len(f) == 0 and f._index_map is None
+            del calls[:]
+
+    def test_read_v1(self, tmpfile):
+        arr = np.arange(1000).reshape(100, 10)
+        with io.open(tmpfile, 'wb') as f:
+            f.write(FORMAT_STRING)
+            write_i64(f, 1)
+            write_json(f, {'foo': 'bar'})
+            meta, frames = pack_blosc(arr, chunks=30)
+            write_packed(f, meta, frames)
+            write_json(f, {'a': [0, 16], 'b': [1, 16 + 8 + len(b'{"foo":"bar"}')],
+                           'c': [1, 16 + 8 + len(b'{"foo":"bar"}'),
+                                 dict((k, v) for k, v in meta.items() if k != 'offsets')]})
+            write_i64(f, 16 + 8 + len(b'{"foo":"bar"}') + write_packed(io.BytesIO(), meta, frames))
+        with File(tmpfile) as f:
+            assert f.format_version == 1 and isinstance(f._index, SortedIndex)
+            assert f.read('a') == {'foo': 'bar'}
+            np.testing.assert_array_equal(f.read('b'), arr)
+            assert f.info('c')['chunks'] == 30
+        with File(tmpfile, 'a') as f:
+            assert f.format_version == 2
+            f.write_json('d', 1)
+            f.delete('a')
+        with File(tmpfile) as f:
+            assert f.format_version == 2 and isinstance(f._index, BinaryIndex)
+            assert list(f) == ['b', 'c', 'd'] and f.read('d') == 1
+            np.testing.assert_array_equal(f['c'][10:20], arr[10:20])
+        with File(tmpfile, 'a') as f:
+            f.write_json('e', 2)
+            f._handle.flush()
+            with File(tmpfile) as g:
+                assert isinstance(g._index, SortedIndex) and list(g) == ['b', 'c', 'd', 'e']
+
+    def test_groups(self, tmpfile):
+        keys = ['day/2026-10-16/ask', 'day/2026-10-16/bid', 'day/2026-10-17/ask',
+                'day/2026-10-17/bid', 'day/2026-10-17/book/0', 'days', 'top']
+        for mode in ('w', 'r', 'a'):
+            with File(tmpfile, mode) as f:
+                if mode == 'w':
+                    for i, key in enumerate(reversed(keys)):
+                        f.write_array(key, np.arange(i)) if i % 2 else f.write_json(key, i)
+                assert list(f) == f.keys() == keys
+                assert f.keys('day/') == keys[:5] and f.keys('day') == keys[:6]
+                assert f.keys('day/2026-10-17/') == keys[2:5] and f.keys('x') == []
+                pytest.raises_regexp(ValueError, 'invalid prefix', f.keys, 1)
+                day = f['day/2026-10-17']
+                assert isinstance(day, Group) and f['day/2026-10-17/'].name == day.name
+                assert day.name == 'day/2026-10-17' and day.file is f
+                assert list(day) == day.keys() == ['ask', 'bid', 'book/0'] and len(day) == 3
+                assert day.keys('b') == ['bid', 'book/0']
+                assert 'ask' in day and 'book' not in day and 1 not in day
+                assert day['ask'] == 4 and day.read('ask') == 4
+                np.testing.assert_array_equal(day['bid'][:], np.arange(3))
+                np.testing.assert_array_equal(day.read('bid', rows=slice(1, 3)), [1, 2])
+                assert day['book'].keys() == ['0'] and f['day']['2026-10-16'].keys() == [
+                    'ask', 'bid']
+                assert repr(day) == "<blox.Group 'day/2026-10-17': 3 keys>"
+                for missing in ('day/2026', 'da', 'top/x', '/', ''):
+                    pytest.raises_regexp(KeyError, missing, f.__getitem__, missing)
+                pytest.raises_regexp(KeyError, 'x', day.__getitem__, 'x')
+                pytest.raises_regexp(ValueError, 'invalid key', day.__getitem__, 1)
+                if mode == 'a':
+                    f.delete('day/2026-10-17/book/0')
+                    f.write_json('day/2026-10-17/a', 1)
+                    assert day.keys() == ['a', 'ask', 'bid']
+                    pytest.raises_regexp(KeyError, 'book', day.__getitem__, 'book')
+
+    def test_cache(self, tmpfile):
+        arr = np.arange(1000).reshape(100, 10)
+        with File(tmpfile, 'w') as f:
+            f.write_array('a', arr, chunks=10)
+            f.write_array('b', arr[:10])
+            f.write_json('c', [1])
+        cache = ArrayCache(arr.nbytes + 10)
+        with File(tmpfile, cache=cache) as f, File(tmpfile, cache=cache) as g:
+            assert f.cache is cache and File(tmpfile).cache is None
+            value = f.read('a')
+            assert not value.flags.writeable and cache.misses == 1 and len(cache) == 1
+            assert g.read('a') is value and cache.hits == 1
+            np.testing.assert_array_equal(f['a'][5:15], arr[5:15])
+            np.testing.assert_array_equal(f.read('a', rows=slice(None, None, -3)), arr[::-3])
+            assert cache.hits == 3
+            out = np.empty_like(arr)
+            assert f.read('a', out=out) is out and cache.hits == 3
+            assert f.read('c') == [1] and cache.hits + cache.misses == 4
+            f.read('b')
+            assert len(cache) == 1 and cache.misses == 2
+            f.read('a')
+            assert cache.misses == 3
+        with File(tmpfile, 'a', cache=1 << 20) as f:
+            first = f.read('b')
+            assert f.read('b') is first and f.cache.hits == 1
+            f.write_array('b', arr[:5], overwrite=True)
+            np.testing.assert_array_equal(f.read('b'), arr[:5])
+            assert f.cache.misses == 2
+            f.repack()
+            np.testing.assert_array_equal(f.read('b'), arr[:5])
+            assert f.cache.misses == 3
+        with File(tmpfile, cache=arr.nbytes - 1) as f:
+            np.testing.assert_array_equal(f.read('a', rows=slice(5, 15)), arr[5:15])
+            assert f.cache.misses == 0
+            value = f.read('a')
+            assert value.flags.writeable and f.cache.misses == 1 and len(f.cache) == 0
+
+    def test_columnar(self, tmpfile):
+        dtype = np.dtype([('ts', 'i8'), ('price', 'f8'), ('side', 'S1')])
+        arr = np.zeros(1000, dtype)
+        arr['ts'], arr['price'], arr['side'] = np.arange(1000), np.linspace(1, 2, 1000), b'b'
+        with File(tmpfile, 'w') as f:
+            f.write_array('a', arr, columnar=True, chunks=100)
+            f.write_many({'b': arr.view(np.recarray), 'c': np.arange(3)}, columnar=True)
+            f.write_array('d', arr)
+            f.write_json('e', 1)
+        with File(tmpfile, cache=1 << 20) as f:
+            assert f.info('a')['columnar'] and f.info('b')['columnar']
+            assert 'columnar' not in f.info('c') and 'columnar' not in f.info('d')
+            assert f.info('a')['chunks'] == 100 and 'chunks' not in f.info('b')
+            assert f.info('a')['compression'] == ('lz4', 5, 1)
+            assert f.info('a')['column_compression'] == dict(
+                (name, ('lz4', 5, 1)) for name in arr.dtype.names)
+            for key in 'abd':
+                np.testing.assert_array_equal(f.read(key), arr)
+                prices = f.read(key, fields=['price'])
+                assert prices.dtype.names == ('price',)
+                np.testing.assert_array_equal(prices['price'], arr['price'])
+                np.testing.assert_array_equal(f.read(key, fields=['side', 'ts'],
+                                                     rows=slice(5, 10))['ts'], arr['ts'][5:10])
+                chunks = list(f.iter_chunks(key, rows=400, fields='ts'))
+                np.testing.assert_array_equal(np.concatenate(chunks)['ts'], arr['ts'])
+            assert isinstance(f.read('b', fields='ts'), np.recarray)
+            assert f.cache.hits == 0 and f.cache.misses == 3
+            pytest.raises_regexp(ValueError, 'can only select fields of array values',
+                                 f.read, 'e', fields=['a'])
+            pytest.raises_regexp(ValueError, 'can only select fields of structured arrays',
+                                 f.read, 'c', fields=['a'])
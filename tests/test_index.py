@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import io
+import pytest
+import numpy as np
+from pytest import raises_regexp
+
+from blox.index import (
+    BinaryIndex, SortedIndex, is_binary_index, read_index_size, write_binary_index
+)
+
+
+@pytest.fixture(params=[0, 1, 2, 100])
+def index(request):
+    keys = [u'key{}'.format(i) for i in range(request.param)]
+    if request.param:
+        keys[-1] = u'ключ/δ'
+    index = {}
+    for i, key in enumerate(keys):
+        if i % 3 == 0:
+            index[key] = [0, 16 + i * 100]
+        elif i % 3 == 1:
+            index[key] = [1, 16 + i * 100, {'shape': [i, 2], 'dtype': 'int64',
+                                            'comp': ['lz4', 5, 1], 'size': i * 16, 'length': i}]
+        else:
+            index[key] = [1, 16 + i * 100]
+    return index
+
+
+def write_index(index, prefix=b''):
+    stream = io.BytesIO()
+    stream.write(prefix)
+    length = write_binary_index(stream, index)
+    assert length == len(stream.getvalue()) - len(prefix)
+    return stream
+
+
+class TestBinaryIndex(object):
+    def test_roundtrip(self, index):
+        stream = write_index(index, b'foo')
+        stream.seek(3)
+        assert is_binary_index(stream) and stream.tell() == 3
+        assert read_index_size(stream) == len(stream.getvalue()) - 3
+        binary = BinaryIndex(stream.getvalue(), 3)
+        assert len(binary) == len(index)
+        assert list(binary) == sorted(index, key=lambda key: key.encode('utf-8'))
+        assert dict(binary.items()) == index
+        for key, entry in index.items():
+            assert key in binary
+            assert binary[key] == entry
+        assert binary == index
+
+    def test_missing(self, index):
+        binary = BinaryIndex(write_index(index).getvalue())
+        for key in ('', 'foo', 'key', 'key00', u'я', 'zzz'):
+            assert key not in binary
+            raises_regexp(KeyError, key, binary.__getitem__, key)
+        assert 42 not in binary and None not in binary
+        assert binary.get('foo') is None
+
+    def test_signature(self):
+        stream = io.BytesIO()
+        stream.write(b'\x10' + b'\x00' * 7)
+        stream.seek(0)
+        assert not is_binary_index(stream)
+        raises_regexp(IOError, 'invalid index signature', read_index_size, stream)
+        raises_regexp(IOError, 'invalid index signature', BinaryIndex, stream.getvalue())
+
+    def test_memoryview(self, index):
+        buffer = np.frombuffer(write_index(index, b'x' * 5).getvalue(), np.uint8)
+        assert dict(BinaryIndex(memoryview(buffer), 5).items()) == index
+
+    def test_iter_prefix(self):
+        keys = [u'a', u'a/b', u'a/b/c', u'a/bc', u'ab', u'b/ключ', u'b/ключи', u'c']
+        binary = BinaryIndex(write_index(dict((key, [0, 16]) for key in keys)).getvalue())
+        for prefix, expected in [(u'', keys), (u'a', keys[:5]), (u'a/', keys[1:4]),
+                                 (u'a/b/', [u'a/b/c']), (u'b/ключ', keys[5:7]), (u'd', []),
+                                 (u'0', [])]:
+            assert list(binary.iter_prefix(prefix)) == expected
+
+
+class TestSortedIndex(object):
+    def test_sorted(self):
+        index = SortedIndex([(u'c', [0, 1]), (u'a', [0, 2])])
+        index[u'b'] = [0, 3]
+        index[u'a'] = [0, 4]
+        assert list(index) == [u'a', u'b', u'c'] and len(index) == 3
+        assert index.items() == [(u'a', [0, 4]), (u'b', [0, 3]), (u'c', [0, 1])]
+        del index[u'b']
+        assert index.pop(u'c') == [0, 1] and index.pop(u'x', None) is None
+        assert list(index) == [u'a'] and u'a' in index and u'b' not in index
+        raises_regexp(KeyError, 'x', index.__delitem__, u'x')
+
+    def test_iter_prefix(self):
+        index = SortedIndex((key, [0, 0]) for key in [u'x/2', u'x/1', u'x', u'y/1', u'x0'])
+        assert list(index.iter_prefix(u'x/')) == [u'x/1', u'x/2']
+        assert list(index.iter_prefix(u'x')) == [u'x', u'x/1', u'x/2', u'x0']
+        assert list(index.iter_prefix(u'z')) == []
@@ -1,11 +1,15 @@
 # -*- coding: utf-8 -*-
 
+import os
 import json
 import pytest
 import numpy as np
 from io import BytesIO
 
-from blox.utils import flatten_dtype, restore_dtype, read_i64, write_i64, read_json, write_json
+from blox.utils import (
+    flatten_dtype, restore_dtype, read_i64, write_i64, read_json, write_json, copy_range,
+    thread_map, BufferStream, PositionalStream, CountingStream
+)
 
 
 @pytest.mark.parametrize('dtype, flattened', [
@@ -14,7 +18,9 @@ from blox.utils import flatten_dtype, restore_dtype, read_i64, write_i64, read_j
     ([('a', '<f4'), ('b', [('c', '<i4'), ('d', '<i2')])],
      [('a', '<f4'), ('b', [('c', '<i4'), ('d', '<i2')])],),
     ((np.record, [('a', '<f4'), ('b', [('c', '<i4'), ('d', '<i2')])]),
-     ('record', [('a', '<f4'), ('b', [('c', '<i4'), ('d', '<i2')])]))
+     ('record', [('a', '<f4'), ('b', [('c', '<i4'), ('d', '<i2')])])),
+    ([('a', '<f4', (2, 3)), ('b', '<i8', (4,))],
+     [('a', '<f4', (2, 3)), ('b', '<i8', (4,))])
 ])
 def test_flatten_restore_dtype(dtype, flattened):
     dtype = np.dtype(dtype)
@@ -51,3 +57,64 @@ def test_read_write_json(data):
     assert json.loads(stream.read(length).decode('utf-8')) == data
     stream.seek(0)
     assert read_json(stream) == data
+
+
+@pytest.mark.parametrize('make_stream', ['buffer', 'positional', 'counting'])
+def test_offset_streams(tmpdir, make_stream):
+    data = b'0123456789'
+    if make_stream == 'buffer':
+        stream = BufferStream(data, 2)
+    elif make_stream == 'counting':
+        stream = CountingStream(BytesIO(data))
+        stream.seek(2)
+    else:
+        path = tmpdir.join('data').strpath
+        with open(path, 'wb') as f:
+            f.write(data)
+        fd = os.open(path, os.O_RDONLY)
+        stream = PositionalStream(fd, 2)
+    assert stream.tell() == 2
+    assert bytes(stream.read(3)) == b'234' and stream.tell() == 5
+    assert stream.seek(1, 1) == 6 and bytes(stream.read()) == b'6789'
+    assert stream.seek(-3, 2) == 7 and bytes(stream.read(10)) == b'789'
+    assert bytes(stream.read(1)) == b''
+    stream.seek(0)
+    buffer = bytearray(4)
+    assert stream.readinto(buffer) == 4 and buffer == b'0123'
+    stream.seek(8)
+    assert stream.readinto(buffer) == 2 and buffer[:2] == b'89'
+    assert stream.count == 3 + 4 + 3 + 4 + 2
+    if make_stream == 'positional':
+        os.close(fd)
+
+
+def test_copy_range(tmpdir):
+    src, dst = tmpdir.join('src').strpath, tmpdir.join('dst').strpath
+    with open(src, 'wb') as f:
+        f.write(b'0123456789')
+    with open(dst, 'wb') as f:
+        f.write(b'abcdef')
+    src_fd, dst_fd = os.open(src, os.O_RDONLY), os.open(dst, os.O_RDWR)
+    try:
+        copied = copy_range(src_fd, dst_fd, 2, 3, 5)
+    finally:
+        os.close(src_fd)
+        os.close(dst_fd)
+    with open(dst, 'rb') as f:
+        assert f.read() == (b'abc23456' if copied == 5 else b'abcdef')
+
+
+@pytest.mark.parametrize('max_workers', [1, 3])
+def test_thread_map(max_workers):
+    submitted = []
+
+    def items():
+        for i in range(50):
+            submitted.append(i)
+            yield i
+    results = thread_map(lambda x: x * 2, items(), max_workers)
+    for i, result in enumerate(results):
+        assert result == i * 2
+        assert len(submitted) <= i + 2 + 2 * max_workers
+    with pytest.raises(ZeroDivisionError):
+        list(thread_map(lambda x: 1 // x, [1, 0, 2], max_workers))